@@ -0,0 +1,77 @@
+"""
+Wall time of Seq2SeqPipeline greedy decoding with and without a draft model.
+
+Runs the model alone (greedy, fixed language) and then with draft_model over
+the clips of one corpus, checks the predictions are identical and reports
+the measured speedup next to the acceptance rate the pipeline writes to
+{corpus}_whisper_assist_stats.json.
+
+    uv run python -m benchmarks.bench_assisted /path/to/clips my_corpus \
+        --model openai/whisper-large-v3 --draft distil-whisper/distil-large-v3 \
+        --device cpu --limit 50
+"""
+import argparse
+import json
+import tempfile
+from pathlib import Path
+import torch
+from trestle.audio import AudioClipDataset, Seq2SeqPipeline
+from benchmarks.common import run_pipeline
+
+
+def run(args, draft, out_root):
+    # a fixed language saves the detection pass in both runs
+    gen_config = dict(num_beams=1, do_sample=False, language=args.language)
+    pipeline = Seq2SeqPipeline(
+        model_name=args.model,
+        corpus=args.corpus,
+        root=args.clips_root,
+        out_root=out_root,
+        meta_root=out_root / "meta",
+        device=args.device,
+        batch_size=args.batch_size,
+        use_flash_attn2=False,
+        gen_config=gen_config,
+        language=args.language,
+        draft_model=draft,
+    )
+    return run_pipeline(pipeline, AudioClipDataset, args.limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("clips_root", type=Path)
+    parser.add_argument("corpus")
+    parser.add_argument("--model", default="openai/whisper-large-v3")
+    parser.add_argument("--draft", default="distil-whisper/distil-large-v3")
+    parser.add_argument("--language", default="english")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        greedy_s, greedy = run(args, None, tmp / "greedy")
+        assisted_s, assisted = run(args, args.draft, tmp / "assisted")
+        stats = json.loads(
+            (tmp / "assisted" / "meta" / f"{args.corpus}_whisper_assist_stats.json").read_text()
+        )
+
+    mismatched = (greedy["prediction"] != assisted["prediction"]).sum()
+    print(f"clips={greedy.height} mismatched={mismatched}")
+    print(f"{'mode':<10}{'run_s':>9}{'speedup':>9}")
+    print(f"{'greedy':<10}{greedy_s:>9.2f}{1.0:>9.2f}")
+    print(f"{'assisted':<10}{assisted_s:>9.2f}{greedy_s / assisted_s:>9.2f}")
+    print(
+        f"acceptance_rate={stats['acceptance_rate']:.3f} "
+        f"est_speedup={stats['est_speedup']:.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
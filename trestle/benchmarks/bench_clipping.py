@@ -0,0 +1,64 @@
+"""
+Compare per-clip loading against decode-once clipping in clip_audio_batch.
+
+Fixed-length clips are cut back to back from each source recording, which
+mimics a CHAT transcript with consecutive utterances.
+
+    uv run python -m benchmarks.bench_clipping /path/to/audio/corpus --limit 5
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import polars as pl
+import torchaudio
+from trestle.io.audio_utils import ClipJob, clip_audio_batch
+
+
+def make_jobs(files, clip_ms, out_dir):
+    jobs = []
+    for src in files:
+        info = torchaudio.info(src)
+        duration_ms = info.num_frames * 1000 // info.sample_rate
+        starts = list(range(0, duration_ms - clip_ms, clip_ms))
+        clips = pl.DataFrame({
+            "pid": [src.stem] * len(starts),
+            "text": [""] * len(starts),
+            "start": starts,
+            "end": [start + clip_ms for start in starts],
+            "clip_path": [str(out_dir / f"{src.stem}_{start}.wav") for start in starts],
+        })
+        jobs.append(ClipJob(src=src, clips=clips))
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("audio_root", type=Path)
+    parser.add_argument("--format", default="wav")
+    parser.add_argument("--clip-ms", type=int, default=3_000)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    files = sorted(args.audio_root.rglob(f"*.{args.format}"))[:args.limit]
+    if not files:
+        raise FileNotFoundError(f"No .{args.format} files under {args.audio_root}")
+
+    print(f"{'mode':<14}{'clips':>8}{'wall_s':>10}{'clips/s':>10}")
+    for decode_once in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = make_jobs(files, args.clip_ms, Path(tmp))
+
+            start = time.perf_counter()
+            num_clips = sum(
+                len(clip_audio_batch(job, decode_once=decode_once))
+                for job in jobs
+            )
+            elapsed = time.perf_counter() - start
+
+        mode = "decode_once" if decode_once else "per_clip"
+        print(f"{mode:<14}{num_clips:>8}{elapsed:>10.2f}{num_clips / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
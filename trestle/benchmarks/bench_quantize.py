@@ -0,0 +1,91 @@
+"""
+Real-time factor and WER of CTCPipeline in float32 against quantize="int8"
+on CPU.
+
+Runs both models over the clips of one corpus (as written by AudioClipper)
+and reports wall time per audio second, WER against the reference text when
+the metadata has one, and the WER between the two models' predictions.
+
+    uv run python -m benchmarks.bench_quantize /path/to/clips my_corpus \
+        --model facebook/wav2vec2-base-960h --limit 200
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import polars as pl
+import torch
+from trestle.audio import AudioClipDataset, CTCPipeline
+from trestle.io.clip_index import clip_durations_ms
+from benchmarks.common import run_pipeline, wer
+
+
+def audio_seconds(clips_root: Path, corpus: str, limit: int | None) -> float:
+    total = 0.0
+    for meta_path in (clips_root / corpus).rglob("metadata.parquet"):
+        df = pl.read_parquet(meta_path)
+        if limit is not None:
+            df = df.head(limit)
+        durations = clip_durations_ms(df)
+        if durations is None:
+            raise ValueError(f"{meta_path} has no duration index, re-run AudioClipper")
+        total += float(durations.sum()) / 1000
+    return total
+
+
+def run(args, quantize, out_root, cache_dir):
+    start = time.perf_counter()
+    pipeline = CTCPipeline(
+        model_name=args.model,
+        corpus=args.corpus,
+        root=args.clips_root,
+        out_root=out_root,
+        device="cpu",
+        batch_size=args.batch_size,
+        use_flash_attn2=False,
+        sort_by_length=True,
+        quantize=quantize,
+        model_cache_dir=cache_dir,
+    )
+    load_s = time.perf_counter() - start
+    return (load_s, *run_pipeline(pipeline, AudioClipDataset, args.limit))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("clips_root", type=Path)
+    parser.add_argument("corpus")
+    parser.add_argument("--model", default="facebook/wav2vec2-base-960h")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    seconds = audio_seconds(args.clips_root, args.corpus, args.limit)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # the second int8 run loads the cached quantized weights
+        for name, quantize in (("fp32", None), ("int8", "int8"), ("int8_cached", "int8")):
+            results[name] = run(args, quantize, tmp / name, tmp / "models")
+
+    fp32 = results["fp32"][2]
+    refs = fp32["transcription"].to_list()
+    has_refs = any(refs)
+
+    print(f"audio_seconds={seconds:.1f} clips={fp32.height}")
+    print(f"{'mode':<13}{'load_s':>8}{'run_s':>9}{'rtf':>8}{'wer':>8}{'wer_vs_fp32':>13}")
+    for name, (load_s, run_s, df) in results.items():
+        hyps = df["prediction"].to_list()
+        ref_wer = f"{wer(refs, hyps):.4f}" if has_refs else "n/a"
+        print(
+            f"{name:<13}{load_s:>8.2f}{run_s:>9.2f}{run_s / seconds:>8.4f}"
+            f"{ref_wer:>8}{wer(fp32['prediction'].to_list(), hyps):>13.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
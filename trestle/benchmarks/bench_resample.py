@@ -0,0 +1,86 @@
+"""
+Compare the AudioWrapper resampling backends on a sample of recordings.
+
+Each backend runs in a fresh process so that peak RSS is not shared between
+runs. Wall time and peak RSS are reported per hour of source audio.
+
+    uv run python -m benchmarks.bench_resample /path/to/corpus/audio --limit 20
+"""
+import argparse
+import resource
+import tempfile
+import time
+from multiprocessing import get_context
+from pathlib import Path
+import torchaudio
+from trestle.io.audio_utils import ConvertJob, convert_audio_file, RESAMPLE_BACKENDS
+
+
+def _run_backend(backend, files, target_sr, queue):
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        failed = 0
+        for src in files:
+            out_path = Path(tmp) / src.with_suffix(".wav").name
+            _, error = convert_audio_file(ConvertJob(
+                src=src,
+                out_path=out_path,
+                target_sr=target_sr,
+                target_format="wav",
+                backend=backend,
+            ))
+            failed += error is not None
+        elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on linux; children covers the pydub ffmpeg calls
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    queue.put((elapsed, max(self_rss, child_rss) / 1024, failed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("audio_root", type=Path)
+    parser.add_argument("--source-format", default="mp3")
+    parser.add_argument("--target-sr", type=int, default=16_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument(
+        "--backends", nargs="+", default=sorted(RESAMPLE_BACKENDS)
+    )
+    args = parser.parse_args()
+
+    files = sorted(args.audio_root.rglob(f"*.{args.source_format}"))
+    files = files[:args.limit]
+    if not files:
+        raise FileNotFoundError(
+            f"No .{args.source_format} files under {args.audio_root}"
+        )
+
+    seconds = 0.0
+    for src in files:
+        info = torchaudio.info(src)
+        seconds += info.num_frames / info.sample_rate
+    hours = seconds / 3600
+
+    print(f"files={len(files)} audio_hours={hours:.3f}")
+    print(f"{'backend':<12}{'wall_s':>10}{'s/hour':>10}{'peak_rss_mb':>14}{'failed':>8}")
+
+    ctx = get_context("spawn")
+    for backend in args.backends:
+        queue = ctx.Queue()
+        proc = ctx.Process(
+            target=_run_backend,
+            args=(backend, files, args.target_sr, queue),
+        )
+        proc.start()
+        elapsed, peak_mb, failed = queue.get()
+        proc.join()
+
+        print(
+            f"{backend:<12}{elapsed:>10.2f}{elapsed / hours:>10.1f}"
+            f"{peak_mb:>14.1f}{failed:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
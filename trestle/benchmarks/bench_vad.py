@@ -0,0 +1,88 @@
+"""
+Wall time and WER of CTCPipeline on untrimmed clips against clips trimmed
+by the energy VAD.
+
+The VAD runs on the fly in AudioClipDataset, so the metadata of the corpus
+is not modified. Reports audio seconds removed, the measured speedup and
+the WER of both runs against the reference text when the metadata has one.
+
+    uv run python -m benchmarks.bench_vad /path/to/clips my_corpus \
+        --model facebook/wav2vec2-base-960h --limit 200 --split-pause-ms 700
+"""
+import argparse
+import tempfile
+from functools import partial
+from pathlib import Path
+import torch
+from trestle.audio import AudioClipDataset, CTCPipeline, VADConfig
+from benchmarks.common import run_pipeline, wer
+
+
+def run(args, dataset_cls, out_root):
+    pipeline = CTCPipeline(
+        model_name=args.model,
+        corpus=args.corpus,
+        root=args.clips_root,
+        out_root=out_root,
+        device=args.device,
+        batch_size=args.batch_size,
+        use_flash_attn2=False,
+        sort_by_length=True,
+    )
+    return run_pipeline(pipeline, dataset_cls, args.limit)
+
+
+def audio_seconds(clips_root: Path, corpus: str, dataset_cls, limit) -> float:
+    total = 0.0
+    for meta_path in sorted((clips_root / corpus).rglob("metadata.parquet")):
+        dataset = dataset_cls(meta_path, limit=limit)
+        for idx in range(len(dataset)):
+            sample = dataset[idx]
+            if sample is not None:
+                total += len(sample["waveform"]) / sample["sampling_rate"]
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("clips_root", type=Path)
+    parser.add_argument("corpus")
+    parser.add_argument("--model", default="facebook/wav2vec2-base-960h")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--threshold-db", type=float, default=35.0)
+    parser.add_argument("--split-pause-ms", type=float, default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    config = VADConfig(threshold_db=args.threshold_db, split_pause_ms=args.split_pause_ms)
+    datasets = {
+        "full": partial(AudioClipDataset, apply_trim=False),
+        "vad": partial(AudioClipDataset, apply_trim=False, vad=config),
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, dataset_cls in datasets.items():
+            seconds = audio_seconds(args.clips_root, args.corpus, dataset_cls, args.limit)
+            results[name] = (seconds, *run(args, dataset_cls, Path(tmp) / name))
+
+    full_s, full_run_s, full = results["full"]
+    refs = full["transcription"].to_list()
+    has_refs = any(refs)
+    print(f"clips={full.height} removed_s={full_s - results['vad'][0]:.1f}")
+    print(f"{'mode':<6}{'audio_s':>9}{'run_s':>9}{'speedup':>9}{'wer':>8}")
+    for name, (seconds, run_s, df) in results.items():
+        ref_wer = f"{wer(refs, df['prediction'].to_list()):.4f}" if has_refs else "n/a"
+        print(
+            f"{name:<6}{seconds:>9.1f}{run_s:>9.2f}"
+            f"{full_run_s / run_s:>9.2f}{ref_wer:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
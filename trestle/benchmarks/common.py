@@ -0,0 +1,43 @@
+"""
+Helpers shared by the benchmarks. Run them as modules from the project root
+so that this package is importable:
+
+    uv run python -m benchmarks.bench_vad ...
+"""
+import time
+import polars as pl
+from trestle.io.table_writer import read_table
+
+
+def word_errors(ref: str, hyp: str) -> tuple[int, int]:
+    """
+    Word-level edit distance and reference length
+    """
+    ref_words, hyp_words = ref.split(), hyp.split()
+    prev = list(range(len(hyp_words) + 1))
+    for i, r in enumerate(ref_words, 1):
+        cur = [i]
+        for j, h in enumerate(hyp_words, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h)))
+        prev = cur
+    return prev[-1], len(ref_words)
+
+
+def wer(refs: list[str], hyps: list[str]) -> float:
+    errors = words = 0
+    for ref, hyp in zip(refs, hyps):
+        e, n = word_errors(ref or "", hyp or "")
+        errors += e
+        words += n
+    return errors / max(words, 1)
+
+
+def run_pipeline(pipeline, dataset_cls, limit: int | None) -> tuple[float, pl.DataFrame]:
+    """
+    Wall time of pipeline.run and the predictions of every output file, in
+    the order the pipeline wrote them
+    """
+    start = time.perf_counter()
+    paths = pipeline.run(dataset_cls, limit=limit)
+    run_s = time.perf_counter() - start
+    return run_s, pl.concat([read_table(p, pipeline.out_format) for p in paths])
@@ -1,7 +1,16 @@
-from .audio_processor import AudioClipper, AudioClipDataset
+from .audio_processor import (
+    AudioClipper, AudioClipDataset, ShardedClipDataset, ConcatClipDataset,
+    PackedClipDataset, trim_metadata,
+)
+from .vad import VADConfig
 from .asr_pipeline import CTCPipeline, Seq2SeqPipeline
+from .parallel import run_data_parallel
+from .multi_model import run_multi_model
 from .audio_wrapper import AudioWrapper
+from .sampler import LengthBucketBatchSampler
 
-__all__ = ['AudioClipper', 'AudioClipDataset',
-           'CTCPipeline', 'Seq2SeqPipeline',
-           'AudioWrapper',]
\ No newline at end of file
+__all__ = ['AudioClipper', 'AudioClipDataset', 'ShardedClipDataset',
+           'ConcatClipDataset', 'PackedClipDataset', 'VADConfig', 'trim_metadata',
+           'CTCPipeline', 'Seq2SeqPipeline', 'run_data_parallel',
+           'run_multi_model',
+           'AudioWrapper', 'LengthBucketBatchSampler',]
\ No newline at end of file
@@ -1,16 +1,238 @@
+from abc import abstractmethod
 from pathlib import Path
+import glob
 import json
+import re
+import shutil
+import time
+import warnings
+import zlib
+from collections import Counter
 from tqdm import tqdm
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Literal
 import polars as pl
 import torch
 from torch.utils.data import DataLoader
+from transformers.modeling_outputs import BaseModelOutput
+from transformers.models.whisper.tokenization_whisper import TO_LANGUAGE_CODE
 from transformers import (
+    AutoConfig,
     AutoProcessor,
     AutoModelForSpeechSeq2Seq,
     AutoModelForCTC,
 )
 from trestle.io.batch_wrapper import BatchWrapperBase
+from trestle.io.clip_index import estimate_from_metadata, DEFAULT_RTF
+from trestle.io.table_writer import ChunkedTableWriter, write_table, read_table
+from trestle.io.profiling import StageTimer
+from trestle.io.result_cache import EncoderCache, ResultCache, audio_hash
+from trestle.audio.sampler import LengthBucketBatchSampler
+from trestle.audio.audio_processor import ConcatClipDataset, PackedClipDataset
+from trestle.audio.model_cache import (
+    CTC_BACKENDS,
+    OnnxCTCModel,
+    compile_ctc,
+    export_ctc_onnx,
+    load_quantized_ctc,
+    save_compile_artifacts,
+)
+
+# rough size of one output row: audio path plus reference and prediction text
+OUTPUT_BYTES_PER_CLIP = 160
+OUTPUT_BYTES_PER_SECOND = 30
+# hidden columns that restore metadata order when the output is finalized
+ORDER_COLS = ["_meta", "_row"]
+
+
+TIMESTAMP_RE = re.compile(r"<\|(\d+(?:\.\d+)?)\|>")
+
+
+def split_by_timestamps(text: str, bounds: list[tuple[float, float]]) -> list[str]:
+    """
+    Split Whisper output decoded with timestamps into one text per clip,
+    giving each segment to the clip its midpoint falls in (or is closest to)
+    """
+    pieces = TIMESTAMP_RE.split(text)
+    chunks, times = pieces[0::2], [float(t) for t in pieces[1::2]]
+    texts: list[list[str]] = [[] for _ in bounds]
+
+    for i, chunk in enumerate(chunks):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        start = times[i - 1] if i > 0 else 0.0
+        end = times[i] if i < len(times) else start
+        mid = (start + end) / 2
+        clip = min(
+            range(len(bounds)),
+            key=lambda j: max(bounds[j][0] - mid, 0.0, mid - bounds[j][1]),
+        )
+        texts[clip].append(chunk)
+
+    return [" ".join(t) for t in texts]
+
+
+def compression_ratio(text: str) -> float:
+    """
+    Whisper's repetition check: high ratios mean looping output
+    """
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+def shard_path(out_path: Path, rank: int) -> Path:
+    """
+    Output of one data-parallel worker, parquet with the order columns kept
+    """
+    return out_path.with_name(f"{out_path.name}.shard-{rank:03d}.parquet")
+
+
+def shard_files(out_path: Path) -> list[Path]:
+    """
+    Worker outputs for out_path, including those of interrupted workers that
+    only left chunks behind
+    """
+    paths = set(out_path.parent.glob(f"{out_path.name}.shard-*.parquet"))
+    for parts_dir in out_path.parent.glob(f"{out_path.name}.shard-*.parquet.parts"):
+        paths.add(parts_dir.with_name(parts_dir.name.removesuffix(".parts")))
+    return sorted(paths)
+
+
+def _shard_rank(path: Path) -> int:
+    # {name}.shard-003.parquet
+    return int(path.name.rsplit(".shard-", 1)[1].split(".")[0])
+
+
+def merge_shards(
+        out_path: Path,
+        out_format: str,
+        num_shards: int,
+        resume: bool = False):
+    """
+    Merge the worker outputs for out_path in metadata order and remove
+    them. When resuming, existing rows no worker covered go last. Without
+    resume, shards of ranks beyond num_shards are left over from an earlier
+    run and dropped.
+    """
+    all_files = shard_files(out_path)
+    files = [
+        f for f in all_files
+        if f.exists() and (resume or _shard_rank(f) < num_shards)
+    ]
+    if not files:
+        return
+    merged = (
+        pl.concat([pl.read_parquet(f) for f in files], how="diagonal_relaxed")
+        .unique("audio_path", keep="first", maintain_order=True)
+        .sort(ORDER_COLS)
+        .drop(ORDER_COLS)
+    )
+    if resume and out_path.exists():
+        # workers already merged the earlier rows of their clips in order
+        existing = read_table(out_path, out_format)
+        existing = existing.filter(
+            ~pl.col("audio_path").is_in(merged["audio_path"].to_list())
+        )
+        merged = pl.concat([merged, existing], how="diagonal_relaxed")
+    write_table(merged, out_path, out_format)
+    for f in all_files:
+        f.unlink(missing_ok=True)
+        shutil.rmtree(f.with_name(f"{f.name}.parts"), ignore_errors=True)
+
+def _rank_path(path: Path, shard: tuple[int, int] | None) -> Path:
+    # stats of one data-parallel worker, merged by merge_shard_stats
+    if shard is None:
+        return path
+    return path.with_name(f"{path.stem}.rank-{shard[0]:03d}{path.suffix}")
+
+
+def assist_stats(counts: dict) -> dict:
+    """
+    Acceptance rate and estimated speedup of assisted decoding from the
+    token, call and time counts
+    """
+    # every target call keeps the accepted draft tokens plus one of its own
+    accepted = counts["tokens"] - counts["target_calls"]
+    # greedy alone would take one target step per token, costed at the
+    # mean verification call; an estimate, bench_assisted.py measures it
+    greedy_s = counts["tokens"] * counts["target_s"] / counts["target_calls"]
+    return {
+        "tokens": counts["tokens"],
+        "draft_tokens": counts["draft_tokens"],
+        "accepted": accepted,
+        "acceptance_rate": accepted / max(counts["draft_tokens"], 1),
+        "target_calls": counts["target_calls"],
+        "target_s": counts["target_s"],
+        "draft_s": counts["draft_s"],
+        "est_speedup": greedy_s / (counts["target_s"] + counts["draft_s"]),
+    }
+
+
+def _sum_stats(stats: list[dict]) -> dict:
+    merged = {}
+    for key in dict.fromkeys(k for s in stats for k in s):
+        values = [s[key] for s in stats if key in s]
+        if isinstance(values[0], dict):
+            merged[key] = _sum_stats(values)
+        else:
+            merged[key] = sum(values)
+    return merged
+
+
+def _rank_stats(meta_root: Path, corpus: str) -> list[Path]:
+    # only this corpus' files, other runs may share meta_root
+    return sorted(Path(meta_root).glob(f"{glob.escape(corpus)}_whisper_*.rank-*.json"))
+
+
+def clear_shard_stats(meta_root: Path, corpus: str):
+    """
+    Remove per-rank stats an earlier data-parallel run of the corpus left
+    behind, so they are not summed into the next one
+    """
+    for path in _rank_stats(meta_root, corpus):
+        path.unlink()
+
+
+def merge_shard_stats(meta_root: Path, corpus: str, num_shards: int):
+    """
+    Sum the decoding stats the workers wrote to {name}.rank-NNN.json into
+    {name}.json and remove them; ranks beyond num_shards are left over from
+    an earlier run and dropped
+    """
+    groups: dict[str, list[Path]] = {}
+    for path in _rank_stats(meta_root, corpus):
+        name, rank = path.stem.rsplit(".rank-", 1)
+        if int(rank) < num_shards:
+            groups.setdefault(name, []).append(path)
+        else:
+            path.unlink()
+
+    for name, paths in groups.items():
+        stats = _sum_stats([json.loads(p.read_text()) for p in paths])
+        if name.endswith("_assist_stats"):
+            # rates are recomputed from the summed counts
+            stats = assist_stats(stats)
+        with open(Path(meta_root) / f"{name}.json", "w") as f:
+            json.dump(stats, f, indent=2)
+        for path in paths:
+            path.unlink()
+
+
+@dataclass
+class DecodeConfig:
+    """
+    A gen_config as passed to generate(), with the temperature schedule
+    taken out of it for the per-sample fallback
+    """
+    name: str | None
+    generate: dict
+    save: dict
+    temperatures: list[float] | None = None
+    compression_ratio_threshold: float | None = None
+    logprob_threshold: float | None = None
+    fallback_stats: Counter = field(default_factory=Counter)
+
 
 @dataclass
 class ClipBatch:
@@ -20,49 +242,151 @@ class ClipBatch:
     meta_files: list[Path]
 
 
-class CTCPipeline(BatchWrapperBase):
+class FeatureCollator:
+    """
+    Run the feature extractor on a list of samples and return CPU tensors.
+    Kept free of the model so it can run inside DataLoader workers.
+    With a cache, samples already predicted get "cached" set and are left
+    out of the features; inputs is None when every sample was a hit.
+    hash_audio adds "audio_hashes" (one per input row) for EncoderCache.
+    """
+    def __init__(
+            self,
+            processor,
+            cache: ResultCache | None = None,
+            hash_audio: bool = False,
+            **processor_kwargs):
+        self.processor = processor
+        self.cache = cache
+        self.hash_audio = hash_audio
+        self.processor_kwargs = processor_kwargs
+
+    def _lookup(self, batch):
+        for b in batch:
+            b["cache_key"] = self.cache.key(b["waveform"], b["sampling_rate"])
+        found = self.cache.get_many([b["cache_key"] for b in batch])
+        for b in batch:
+            if b["cache_key"] in found:
+                b["cached"] = found[b["cache_key"]]
+        return [b for b in batch if "cached" not in b]
+
+    def __call__(self, batch):
+        batch = [b for b in batch if b is not None]
+        if not batch:
+            return None, None, {}
+
+        start = time.perf_counter()
+        todo = self._lookup(batch) if self.cache is not None else batch
+        stats = {"decode": sum(b.get("decode_s", 0.0) for b in batch)}
+        if not todo:
+            return None, batch, stats
+
+        waveforms = [b["waveform"] for b in todo]
+        sr = todo[0]["sampling_rate"]
+
+        inputs = self.processor(
+            waveforms,
+            sampling_rate=sr,
+            return_tensors="pt",
+            **self.processor_kwargs,
+        )
+
+        inputs = dict(inputs)
+        if self.hash_audio:
+            inputs["audio_hashes"] = [
+                audio_hash(b["waveform"], b["sampling_rate"]) for b in todo
+            ]
+        stats["features"] = time.perf_counter() - start
+        return inputs, batch, stats
+
+
+class ASRPipelineBase(BatchWrapperBase):
+    """
+    Batching over metadata.parquet files and the inference loop shared by the
+    ASR pipelines. Subclasses load the model and implement _collator,
+    _forward, _decode and _make_record.
+    """
+    desc = "ASR"
+
     def __init__(
             self,
-            model_name: str,
             corpus: str,
             root: Path,
             out_root: Path,
-            device: str | torch.device = "cuda",
-            batch_size: int = 8,
-            format: str = 'wav',
-            out_format: str = 'parquet',
-            dry_run: bool = False,
-            use_flash_attn2: bool = True):
+            device: str | torch.device,
+            batch_size: int,
+            out_format: str,
+            dry_run: bool,
+            est_rtf: float,
+            sort_by_length: bool = False,
+            max_samples_per_batch: int | None = None,
+            num_workers: int = 0,
+            prefetch_factor: int | None = None,
+            persistent_workers: bool = False,
+            pin_memory: bool | None = None,
+            span: Literal["metafile", "subset", "corpus"] = "metafile",
+            flush_every: int = 1000,
+            resume: bool = False,
+            cache_path: Path | None = None,
+            cache_max_mb: float = 1024,
+            shard: tuple[int, int] | None = None):
+        """
+        num_workers: DataLoader worker processes decoding audio and running
+                     the feature extractor while the model runs
+        prefetch_factor: batches loaded ahead by each worker
+        persistent_workers: keep workers alive between metadata files
+        pin_memory: page-locked batches for faster host-to-device copies,
+                    defaults to True on cuda
+        span: clips batched together: per metadata file, per subset (all
+              metadata files of one output) or across the whole corpus.
+              Predictions are always written to their own subset's output.
+        flush_every: predictions buffered before a chunk is written next to
+                     the output, so an interrupted run loses at most that many
+        resume: keep predictions already in the output (or in chunks left by
+                an interrupted run) and only run the remaining clips
+        cache_path: sqlite file caching predictions by model, config and
+                    clip audio, so re-cut or repeated clips skip inference
+        cache_max_mb: cache size before least recently used entries go
+        shard: (rank, num_shards) when run as a data-parallel worker: only a
+               contiguous block of each metadata file is processed and the
+               output goes to a shard file merged by run_data_parallel
+        """
         super().__init__(
             corpus=corpus,
             root=Path(root) / corpus,
             out_root=Path(out_root),
             modality_dir="clips",
         )
-
         self.batch_size = batch_size
         self.device = torch.device(device)
-        self.format = format
         self.out_format = out_format
         self.dry_run = dry_run
-        self.device = self.device
-        self.model_name = model_name
+        self.est_rtf = est_rtf
+        self.sort_by_length = sort_by_length
+        self.max_samples_per_batch = max_samples_per_batch
+        self.num_workers = num_workers
+        self.prefetch_factor = prefetch_factor
+        self.persistent_workers = persistent_workers and num_workers > 0
+        if pin_memory is None:
+            pin_memory = self.device.type == "cuda"
+        self.pin_memory = pin_memory
+        if span not in ("metafile", "subset", "corpus"):
+            raise ValueError(f"Unknown span '{span}'")
+        self.span = span
+        self.flush_every = flush_every
+        self.resume = resume
+        self.cache_path = cache_path
+        self.cache_max_mb = cache_max_mb
+        self.cache: ResultCache | None = None
+        self.shard = shard
         self.dtype = torch.float16 if self.device.type == "cuda" else torch.float32
-        attn_impl = "flash_attention_2" if use_flash_attn2 else 'sdpa'
 
-        self.processor = AutoProcessor.from_pretrained(model_name)
-        self.model = AutoModelForCTC.from_pretrained(
-            model_name,
-            dtype=self.dtype,
-            low_cpu_mem_usage=True,
-            # use_safetensors=True,
-            # device_map="cuda" if self.device.type == "cuda" else None,
-            attn_implementation=attn_impl)
-        self.model.eval()
-        self.model = self.model.to(self.device)
+    @property
+    def model_base(self) -> str:
+        return self.model_name.split("/")[-1]
 
     def _iter_files(self):
-        return self.root.rglob(f"metadata.parquet")
+        return self.root.rglob("metadata.parquet")
 
     def _make_batch(self, subset, suffix, files):
         return ClipBatch(
@@ -72,91 +396,586 @@ class CTCPipeline(BatchWrapperBase):
             meta_files=files,
         )
 
-    def _collate(self, batch):
-        batch = [b for b in batch if b is not None]
-        if not batch:
-            return None, None
+    def _dry_run_report(self, batch, out_path: Path, limit: int | None):
+        """
+        Report audio hours, output size and runtime from the metadata index,
+        without opening any audio
+        """
+        estimate = estimate_from_metadata(
+            batch.meta_files,
+            bytes_per_second=OUTPUT_BYTES_PER_SECOND,
+            rtf=self.est_rtf,
+            bytes_per_clip=OUTPUT_BYTES_PER_CLIP,
+            limit=limit,
+        )
+        print(f"[DRY] {out_path}\n{estimate}")
 
-        waveforms = [b["waveform"] for b in batch]
-        sr = batch[0]["sampling_rate"]
+    @abstractmethod
+    def _collator(self) -> FeatureCollator:
+        pass
 
-        inputs = self.processor(
-            waveforms,
-            sampling_rate=sr,
-            return_tensors="pt",
-            padding=True,
+    @abstractmethod
+    def _forward(self, inputs):
+        pass
+
+    @abstractmethod
+    def _decode(self, outputs) -> list[str]:
+        pass
+
+    @abstractmethod
+    def _make_record(self, sample, pred: str) -> dict:
+        pass
+
+    def _on_run_start(self):
+        pass
+
+    def _on_run_end(self):
+        pass
+
+    def _wrap_dataset(self, dataset):
+        return dataset
+
+    def _heads(self) -> list[str | None]:
+        """
+        Outputs written per run; None is the plain {model}_output file
+        """
+        return [None]
+
+    def _head_path(self, out_path: Path, head: str | None) -> Path:
+        if head is None:
+            return out_path
+        return out_path.with_name(f"{self.model_base}_{head}_output.{self.out_format}")
+
+    def _unpack(self, sample, pred):
+        """
+        (clip sample, prediction) pairs for one model input
+        """
+        yield sample, pred
+
+    def _cache_namespace(self) -> dict:
+        """
+        Everything besides the audio that changes a prediction
+        """
+        return {
+            "pipeline": type(self).__name__,
+            "model": self.model_name,
+            "revision": getattr(self.model.config, "_commit_hash", None),
+            "dtype": str(self.dtype),
+        }
+
+    def _open_cache(self):
+        if self.cache_path is not None and self.cache is None:
+            self.cache = ResultCache(
+                self.cache_path,
+                namespace=self._cache_namespace(),
+                max_mb=self.cache_max_mb,
+            )
+
+    def _make_loader(self, dataset, collate_fn=None) -> DataLoader:
+        """
+        Fixed-size batches in metadata order, or length-bucketed batches when
+        sort_by_length/max_samples_per_batch is set
+        """
+        loader_kwargs = dict(
+            collate_fn=collate_fn or self._collator(),
+            num_workers=self.num_workers,
+            pin_memory=self.pin_memory,
+            persistent_workers=self.persistent_workers,
         )
+        if self.num_workers > 0 and self.prefetch_factor is not None:
+            loader_kwargs["prefetch_factor"] = self.prefetch_factor
+
+        if not (self.sort_by_length or self.max_samples_per_batch):
+            return DataLoader(
+                dataset,
+                batch_size=self.batch_size,
+                shuffle=False,
+                **loader_kwargs,
+            )
 
-        inputs["input_values"] = inputs["input_values"].to(
-            self.device, dtype=self.dtype
+        if not hasattr(dataset, "clip_lengths"):
+            raise TypeError(
+                f"{type(dataset).__name__} has no clip_lengths(), "
+                "required for length-bucketed batching"
+            )
+        sampler = LengthBucketBatchSampler(
+            dataset.clip_lengths(),
+            batch_size=None if self.max_samples_per_batch else self.batch_size,
+            max_samples_per_batch=self.max_samples_per_batch,
+        )
+        return DataLoader(
+            dataset,
+            batch_sampler=sampler,
+            **loader_kwargs,
         )
 
-        # speical case for hubert
-        if "attention_mask" in inputs:
-            inputs["attention_mask"] = inputs["attention_mask"].to(self.device)
+    def _to_device(self, inputs: dict) -> dict:
+        """
+        Move collated CPU tensors to the model device; float inputs are cast
+        to the model dtype
+        """
+        non_blocking = self.pin_memory and self.device.type == "cuda"
+        return {
+            k: v.to(
+                self.device,
+                dtype=self.dtype if v.is_floating_point() else None,
+                non_blocking=non_blocking,
+            )
+            if torch.is_tensor(v) else v
+            for k, v in inputs.items()
+        }
 
-        return inputs, batch
+    def _sync(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
 
-    @torch.no_grad()
-    def run(
-            self,
-            dataset_cls, limit: int | None = None):
+    def _plan_groups(self, limit: int | None):
         """
-        dataset_cls: callable(meta_path) -> AudioClipData
+        Returns {out_path: number of metadata files} and the groups of
+        (out_path, meta_path, position of meta_path in its batch) units that
+        share one DataLoader
         """
-        model_base = self.model_name.split("/")[-1]
+        remaining: dict[Path, int] = {}
+        groups: list[list[tuple[Path, Path, int]]] = []
+
         for batch in self.iter_batches():
             out_dir = self.resolve_out_dir(batch)
-            out_path = out_dir / f"{model_base}_output.{self.out_format}"
+            out_path = out_dir / f"{self.model_base}_output.{self.out_format}"
 
-            records = []
+            if self.dry_run:
+                self._dry_run_report(batch, out_path, limit)
+                continue
+
+            units = [
+                (out_path, meta_path, pos)
+                for pos, meta_path in enumerate(sorted(batch.meta_files))
+            ]
+            remaining[out_path] = len(units)
+            if self.span == "metafile":
+                groups.extend([unit] for unit in units)
+            elif self.span == "subset" or not groups:
+                groups.append(units)
+            else:
+                groups[0].extend(units)
+
+        return remaining, groups
+
+    def _open_writer(self, out_path: Path) -> tuple[ChunkedTableWriter, set[str]]:
+        """
+        Chunked writer for out_path (or this worker's shard of it) and, when
+        resuming, the clips already predicted
+        """
+        if self.shard is None:
+            writer = ChunkedTableWriter(
+                out_path, format=self.out_format, flush_every=self.flush_every
+            )
+            siblings = [writer]
+        else:
+            writer = ChunkedTableWriter(
+                shard_path(out_path, self.shard[0]),
+                format="parquet",
+                flush_every=self.flush_every,
+            )
+            # other workers' leftovers count too, num_shards may have changed
+            siblings = [
+                ChunkedTableWriter(p, format="parquet")
+                for p in {*shard_files(out_path), writer.out_path}
+            ]
+
+        if not self.resume:
+            writer.clear()
+            if self.shard is not None:
+                writer.out_path.unlink(missing_ok=True)
+            return writer, set()
+
+        frames = [self._read_existing(out_path)]
+        for sibling in siblings:
+            frames.append(sibling.read_parts())
+            if sibling.out_path != out_path and sibling.out_path.exists():
+                frames.append(pl.read_parquet(sibling.out_path))
+
+        done: set[str] = set()
+        for df in frames:
+            if df is not None and "audio_path" in df.columns:
+                done.update(df["audio_path"].to_list())
+        if done:
+            print(f"[RESUME] {out_path}: {len(done)} clips already predicted")
+        return writer, done
 
-            for meta_path in batch.meta_files:
-                dataset = dataset_cls(meta_path, limit=limit)
+    def _read_existing(self, out_path: Path) -> pl.DataFrame | None:
+        if not (self.resume and out_path.exists()):
+            return None
+        return read_table(out_path, self.out_format)
 
-                loader = DataLoader(
-                    dataset,
-                    batch_size=self.batch_size,
-                    shuffle=False,
-                    collate_fn=self._collate,
+    def _finalize(
+            self,
+            writer: ChunkedTableWriter,
+            out_path: Path,
+            order: pl.DataFrame | None = None):
+        """
+        Merge the chunks and any earlier output in metadata order and write
+        out_path. order (audio_path, _meta, _row) places the rows of earlier
+        runs; those the metadata no longer has go last. Workers keep the
+        order columns in their shard for merge_shards.
+        """
+        writer.flush()
+        parts = writer.read_parts()
+        existing = self._read_existing(out_path)
+        if existing is not None and order is not None:
+            existing = existing.join(order, on="audio_path", how="left")
+
+        if self.shard is not None:
+            frames = [parts]
+            if self.resume and writer.out_path.exists():
+                frames.insert(0, pl.read_parquet(writer.out_path))
+            # earlier output of this worker's clips; merge_shards keeps
+            # the rest
+            if existing is not None and order is not None:
+                frames.append(existing.filter(pl.col("_meta").is_not_null()))
+            frames = [df for df in frames if df is not None]
+            if frames:
+                write_table(
+                    pl.concat(frames, how="diagonal_relaxed"),
+                    writer.out_path,
+                    "parquet",
                 )
+            writer.clear()
+            return
 
-                for inputs, samples in tqdm(
-                    loader, desc=f"CTC inference on {self.corpus}",
-                    leave=False
-                ):
-                    if inputs is None:
-                        continue
-
-                    logits = self.model(**inputs).logits
-                    pred_ids = torch.argmax(logits, dim=-1)
-                    preds = self.processor.batch_decode(pred_ids)
-
-                    for sample, pred in zip(samples, preds):
-                        records.append(
-                            {
-                                "audio_path": sample["clip_path"],
-                                "prediction": pred,
-                                "transcription": sample.get("transcription").upper()
-                                if sample.get("transcription")
-                                else None,
-                            }
-                        )
-
-            df = pl.DataFrame(records)
+        if parts is not None:
+            parts = parts.sort(ORDER_COLS)
+        frames = [df for df in (existing, parts) if df is not None]
+        if frames:
+            df = pl.concat(frames, how="diagonal_relaxed")
+            if order is not None:
+                df = df.sort(ORDER_COLS, nulls_last=True, maintain_order=True)
+            write_table(
+                df.drop(ORDER_COLS, strict=False),
+                writer.out_path,
+                self.out_format,
+            )
+        writer.clear()
+
+    def _open_writers(self, remaining: dict[Path, int]):
+        """
+        A writer and the clips already predicted for every output of every
+        head
+        """
+        writers: dict[Path, ChunkedTableWriter] = {}
+        done: dict[Path, set[str]] = {}
+        # filled by _record_order, consumed by _end_group
+        self._resume_order: dict[Path, list[pl.DataFrame]] = {}
+        for out_path in remaining:
+            for head in self._heads():
+                head_path = self._head_path(out_path, head)
+                writers[head_path], done[head_path] = self._open_writer(head_path)
+        return writers, done
+
+    def _done_clips(self, out_path: Path, done: dict[Path, set[str]]) -> set[str]:
+        # only clips every head already has are skipped
+        return set.intersection(*(
+            done[self._head_path(out_path, head)] for head in self._heads()
+        ))
+
+    def _record_order(self, group, dataset_cls, limit):
+        """
+        When resuming, remember the metadata position of every clip so the
+        output of earlier runs is merged in order
+        """
+        if not self.resume:
+            return
+        for out_path, meta_path, pos in group:
+            dataset = dataset_cls(meta_path, limit=limit)
+            if not hasattr(dataset, "clip_paths"):
+                continue
+            if self.shard is not None:
+                dataset.shard(*self.shard)
+            self._resume_order.setdefault(out_path, []).append(
+                pl.DataFrame({
+                    "audio_path": dataset.clip_paths(),
+                    "_meta": pl.repeat(pos, dataset.df.height, dtype=pl.Int64, eager=True),
+                    "_row": dataset.df["_row"].cast(pl.Int64),
+                })
+            )
+
+    def _group_dataset(self, group, dataset_cls, limit, skips: list[set[str]]):
+        datasets = []
+        for (_, meta_path, _), skip in zip(group, skips):
+            dataset = dataset_cls(meta_path, limit=limit)
+            if self.shard is not None:
+                dataset.shard(*self.shard)
+            if skip:
+                dataset.exclude(skip)
+            datasets.append(self._wrap_dataset(dataset))
+        return ConcatClipDataset(datasets)
+
+    def _process_batch(self, group, inputs, samples, stats, writers, done, timer) -> int:
+        """
+        Predict one collated batch and write the records; returns the
+        number of result cache hits
+        """
+        for stage, seconds in stats.items():
+            timer.add(stage, seconds)
+
+        todo = [s for s in samples if "cached" not in s]
+        preds = []
+        if inputs is not None:
+            with timer.stage("forward"):
+                outputs = self._forward(self._to_device(inputs))
+                self._sync()
+            with timer.stage("to_text"):
+                preds = self._decode(outputs)
+
+        hits = 0
+        if self.cache is not None:
+            with timer.stage("cache"):
+                self.cache.touch(
+                    [s["cache_key"] for s in samples if "cached" in s]
+                )
+                self.cache.put_many({
+                    s["cache_key"]: pred for s, pred in zip(todo, preds)
+                })
+            hits = len(samples) - len(todo)
+            for s, pred in zip(todo, preds):
+                s["cached"] = pred
+            preds = [s["cached"] for s in samples]
+
+        # one list of predictions per head
+        if not isinstance(preds, dict):
+            preds = {None: preds}
+
+        with timer.stage("write"):
+            for head, head_preds in preds.items():
+                for sample, pred in zip(samples, head_preds):
+                    out_path, _, pos = group[sample["part"]]
+                    head_path = self._head_path(out_path, head)
+                    for clip, clip_pred in self._unpack(sample, pred):
+                        if clip["clip_path"] in done[head_path]:
+                            continue
+                        record = self._make_record(clip, clip_pred)
+                        record["_meta"] = pos
+                        record["_row"] = clip.get("row", clip["index"])
+                        writers[head_path].write([record])
+        return hits
+
+    def _end_group(self, group, remaining, writers, timer, num_clips, hits, label=None):
+        label = label or self.corpus
+        if self.cache is not None:
+            print(f"[CACHE] {label}: hits={hits} misses={num_clips - hits}")
+        # decode/features run in loader workers when num_workers > 0, so
+        # only loader_wait shows how long the model was starved
+        print(f"[TIMING] {label}: {timer.summary(num_clips)}")
+
+        for out_path, _, _ in group:
+            remaining[out_path] -= 1
+            if remaining[out_path] == 0:
+                order = self._resume_order.pop(out_path, None)
+                if order:
+                    order = pl.concat(order).unique(
+                        "audio_path", keep="first", maintain_order=True
+                    )
+                for head in self._heads():
+                    head_path = self._head_path(out_path, head)
+                    self._finalize(writers.pop(head_path), head_path, order)
+
+    def _output_paths(self, out_paths: list[Path]) -> list[Path]:
+        return [
+            self._head_path(out_path, head)
+            for out_path in out_paths for head in self._heads()
+        ]
+
+    @torch.no_grad()
+    def run(self, dataset_cls, limit: int | None = None) -> list[Path]:
+        """
+        dataset_cls: callable(meta_path) -> AudioClipDataset
+        Returns the output paths
+        """
+        self._on_run_start()
+        self._open_cache()
+        remaining, groups = self._plan_groups(limit)
+        out_paths = list(remaining)
+        writers, done = self._open_writers(remaining)
+
+        for group in groups:
+            skips = [self._done_clips(out_path, done) for out_path, _, _ in group]
+            self._record_order(group, dataset_cls, limit)
+            dataset = self._group_dataset(group, dataset_cls, limit, skips)
+            loader = self._make_loader(dataset)
+            timer = StageTimer()
+            num_clips = 0
+            hits = 0
+
+            for inputs, samples, stats in timer.iter(
+                tqdm(
+                    loader,
+                    desc=f"{self.desc} inference on {self.corpus}",
+                    leave=False,
+                ),
+                "loader_wait",
+            ):
+                if samples is None:
+                    continue
+                hits += self._process_batch(
+                    group, inputs, samples, stats, writers, done, timer
+                )
+                num_clips += len(samples)
+
+            self._end_group(group, remaining, writers, timer, num_clips, hits)
+
+        self._on_run_end()
+        return self._output_paths(out_paths)
+
+
+class CTCPipeline(ASRPipelineBase):
+    desc = "CTC"
+
+    def __init__(
+            self,
+            model_name: str,
+            corpus: str,
+            root: Path,
+            out_root: Path,
+            device: str | torch.device = "cuda",
+            batch_size: int = 8,
+            format: str = 'wav',
+            out_format: str = 'parquet',
+            dry_run: bool = False,
+            use_flash_attn2: bool = True,
+            est_rtf: float | None = None,
+            sort_by_length: bool = False,
+            max_samples_per_batch: int | None = None,
+            num_workers: int = 0,
+            prefetch_factor: int | None = None,
+            persistent_workers: bool = False,
+            pin_memory: bool | None = None,
+            span: Literal["metafile", "subset", "corpus"] = "metafile",
+            flush_every: int = 1000,
+            resume: bool = False,
+            cache_path: Path | None = None,
+            cache_max_mb: float = 1024,
+            shard: tuple[int, int] | None = None,
+            quantize: Literal["int8"] | None = None,
+            model_cache_dir: Path | None = None,
+            backend: Literal["eager", "onnx", "compile"] = "eager"):
+        """
+        quantize: "int8" applies dynamic quantization to the linear layers
+                  for faster CPU inference (device must be cpu)
+        model_cache_dir: where quantized weights, ONNX exports and compile
+                         artifacts are cached, defaults to
+                         ~/.cache/trestle/models
+        backend: "eager" PyTorch, "onnx" (exported once, run with
+                 onnxruntime on cpu) or "compile" (torch.compile, warm-started
+                 from the artifacts of earlier runs)
+        """
+        if quantize not in (None, "int8"):
+            raise ValueError(f"Unknown quantize '{quantize}'")
+        if backend not in CTC_BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}'")
+        if quantize and backend != "eager":
+            raise ValueError("quantize='int8' runs on the eager backend only")
+        if (quantize or backend == "onnx") and torch.device(device).type != "cpu":
+            raise ValueError(f"{quantize or backend} runs on cpu only")
+        super().__init__(
+            corpus=corpus,
+            root=root,
+            out_root=out_root,
+            device=device,
+            batch_size=batch_size,
+            out_format=out_format,
+            dry_run=dry_run,
+            est_rtf=est_rtf if est_rtf is not None else DEFAULT_RTF["ctc"],
+            sort_by_length=sort_by_length,
+            max_samples_per_batch=max_samples_per_batch,
+            num_workers=num_workers,
+            prefetch_factor=prefetch_factor,
+            persistent_workers=persistent_workers,
+            pin_memory=pin_memory,
+            span=span,
+            flush_every=flush_every,
+            resume=resume,
+            cache_path=cache_path,
+            cache_max_mb=cache_max_mb,
+            shard=shard,
+        )
+
+        self.format = format
+        self.model_name = model_name
+        attn_impl = "flash_attention_2" if use_flash_attn2 else 'sdpa'
+
+        self.quantize = quantize
+        self.backend = backend
+        self.model_cache_dir = model_cache_dir
+
+        self.processor = AutoProcessor.from_pretrained(model_name)
+        if quantize == "int8":
+            self.model = load_quantized_ctc(model_name, model_cache_dir)
+        elif backend == "onnx":
+            # the collator passes an attention mask only if the feature
+            # extractor returns one
+            onnx_path = export_ctc_onnx(
+                model_name,
+                with_attention_mask=self.processor.feature_extractor.return_attention_mask,
+                cache_dir=model_cache_dir,
+            )
+            self.model = OnnxCTCModel(
+                onnx_path,
+                AutoConfig.from_pretrained(model_name),
+                num_threads=torch.get_num_threads(),
+            )
+        else:
+            self.model = AutoModelForCTC.from_pretrained(
+                model_name,
+                dtype=self.dtype,
+                low_cpu_mem_usage=True,
+                # use_safetensors=True,
+                # device_map="cuda" if self.device.type == "cuda" else None,
+                attn_implementation=attn_impl)
+        self.model.eval()
+        self.model = self.model.to(self.device)
+        if backend == "compile":
+            self.model = compile_ctc(self.model, model_name, model_cache_dir)
+
+    def _on_run_end(self):
+        if self.backend == "compile":
+            save_compile_artifacts(self.model_name, self.model_cache_dir)
+
+    @property
+    def model_base(self) -> str:
+        # quantized predictions do not overwrite the float ones
+        base = super().model_base
+        return f"{base}-{self.quantize}" if self.quantize else base
+
+    def _cache_namespace(self):
+        return {
+            **super()._cache_namespace(),
+            "quantize": self.quantize,
+            "backend": self.backend,
+        }
+
+    def _collator(self):
+        # hubert checkpoints also return an attention mask
+        return FeatureCollator(self.processor, cache=self.cache, padding=True)
+
+    def _forward(self, inputs):
+        logits = self.model(**inputs).logits
+        return torch.argmax(logits, dim=-1)
+
+    def _decode(self, pred_ids):
+        return self.processor.batch_decode(pred_ids)
+
+    def _make_record(self, sample, pred):
+        return {
+            "audio_path": sample["clip_path"],
+            "prediction": pred,
+            "transcription": sample.get("transcription").upper()
+            if sample.get("transcription")
+            else None,
+        }
+
+
+class Seq2SeqPipeline(ASRPipelineBase):
+    desc = "Whisper"
 
-            if self.dry_run:
-                print(f"[DRY] {out_path}")
-                print(df)
-            else:
-                if self.out_format == "parquet":
-                    df.write_parquet(out_path)
-                elif self.out_format == 'csv':
-                    df.write_csv(out_path)
-                elif self.out_format == 'jsonl':
-                    df.write_csv(out_path)
-
-class Seq2SeqPipeline(BatchWrapperBase):
     def __init__(
         self,
         model_name: str,
@@ -171,22 +990,64 @@ class Seq2SeqPipeline(BatchWrapperBase):
         use_flash_attn2: bool = True,
         gen_config: dict | None = None,
         language: str = "english",
+        est_rtf: float | None = None,
+        sort_by_length: bool = False,
+        max_samples_per_batch: int | None = None,
+        num_workers: int = 0,
+        prefetch_factor: int | None = None,
+        persistent_workers: bool = False,
+        pin_memory: bool | None = None,
+        span: Literal["metafile", "subset", "corpus"] = "metafile",
+        flush_every: int = 1000,
+        resume: bool = False,
+        cache_path: Path | None = None,
+        cache_max_mb: float = 1024,
+        shard: tuple[int, int] | None = None,
+        pack: bool = False,
+        encoder_cache_dir: Path | None = None,
+        draft_model: str | None = None,
     ):
+        """
+        pack: join consecutive clips of the same recording into windows of
+              up to 30 s, decode with timestamps and split the text back to
+              the clips, instead of padding every clip to 30 s
+        encoder_cache_dir: keep encoder hidden states per clip on disk so
+                           later runs and sweeps skip the encoder
+        draft_model: small whisper sharing the tokenizer (e.g.
+                     distil-whisper) proposing tokens the model verifies;
+                     output equals greedy decoding with the model alone.
+                     Greedy gen_config only, clips are decoded one by one;
+                     a language in gen_config saves the detection pass
+        """
         super().__init__(
             corpus=corpus,
-            root=Path(root) / corpus,
-            out_root=Path(out_root),
-            modality_dir="clips",
+            root=root,
+            out_root=out_root,
+            device=device,
+            batch_size=batch_size,
+            out_format=out_format,
+            dry_run=dry_run,
+            est_rtf=est_rtf if est_rtf is not None else DEFAULT_RTF["seq2seq"],
+            sort_by_length=sort_by_length,
+            max_samples_per_batch=max_samples_per_batch,
+            num_workers=num_workers,
+            prefetch_factor=prefetch_factor,
+            persistent_workers=persistent_workers,
+            pin_memory=pin_memory,
+            span=span,
+            flush_every=flush_every,
+            resume=resume,
+            cache_path=cache_path,
+            cache_max_mb=cache_max_mb,
+            shard=shard,
         )
 
-        self.batch_size = batch_size
-        self.device = torch.device(device)
-        self.out_format = out_format
-        self.dry_run = dry_run
         self.meta_root = Path(meta_root)
         self.meta_root.mkdir(parents=True, exist_ok=True)
+        self.language = language
+        self.pack = pack
+        self._packed = [0, 0]
 
-        self.dtype = torch.float16 if self.device.type == "cuda" else torch.float32
         attn_impl = "flash_attention_2" if use_flash_attn2 else "sdpa"
 
         self.processor = AutoProcessor.from_pretrained(
@@ -203,121 +1064,506 @@ class Seq2SeqPipeline(BatchWrapperBase):
         ).to(self.device)
 
         self.model.eval()
+        self.model_name = self.model.config.name_or_path
+
+        self.decode_config = self._prepare_gen_config(gen_config)
+        self.gen_config = self.decode_config.generate
+        self.gen_config_save = self.decode_config.save
+        # set by sweep() for the duration of a run
+        self._sweep: dict[str, DecodeConfig] | None = None
+
+        # English-only checkpoints take no language
+        self._multilingual = bool(getattr(self.model.generation_config, "lang_to_id", None))
+        self.encoder_cache = None
+        if encoder_cache_dir is not None:
+            self.encoder_cache = EncoderCache(
+                encoder_cache_dir,
+                namespace={
+                    "model": self.model_name,
+                    "revision": getattr(self.model.config, "_commit_hash", None),
+                    "dtype": str(self.dtype),
+                },
+            )
+        self._encoder_stats: Counter = Counter()
+
+        self.draft = None
+        self._assist_stats: Counter = Counter()
+        if draft_model is not None:
+            self._load_draft(draft_model, attn_impl)
+
+    def _load_draft(self, draft_model: str, attn_impl: str):
+        config = self.decode_config
+        if (
+            config.temperatures
+            or config.generate.get("do_sample")
+            or (config.generate.get("num_beams") or 1) > 1
+        ):
+            raise ValueError("draft_model needs a greedy gen_config (num_beams=1, no sampling)")
+        if self.encoder_cache is not None:
+            raise ValueError("draft_model does not run on cached encoder states")
+
+        self.draft = AutoModelForSpeechSeq2Seq.from_pretrained(
+            draft_model,
+            dtype=self.dtype,
+            low_cpu_mem_usage=True,
+            attn_implementation=attn_impl,
+        ).to(self.device)
+        self.draft.eval()
+        if self.draft.config.vocab_size != self.model.config.vocab_size:
+            raise ValueError(f"{draft_model} does not share the tokenizer of {self.model_name}")
+
+        # decoder calls and time of both models, for the [ASSIST] summary
+        for name, model in (("target", self.model), ("draft", self.draft)):
+            decoder = model.get_decoder()
+            decoder.register_forward_pre_hook(self._start_call)
+            decoder.register_forward_hook(
+                lambda *_, name=name: self._end_call(name)
+            )
+
+    def _start_call(self, *_):
+        self._call_start = time.perf_counter()
+
+    def _end_call(self, name: str):
+        self._assist_stats[f"{name}_calls"] += 1
+        self._assist_stats[f"{name}_s"] += time.perf_counter() - self._call_start
 
+    def _prepare_gen_config(
+            self,
+            gen_config: dict | None,
+            name: str | None = None) -> DecodeConfig:
         raw_gen = dict(gen_config or {})
 
         initial_prompt = raw_gen.pop("initial_prompt", None)
 
-        self.gen_config_save = dict(raw_gen)
-        self.gen_config = dict(raw_gen)
+        config = DecodeConfig(name=name, generate=dict(raw_gen), save=dict(raw_gen))
 
         if initial_prompt:
             prompt_ids = self.processor.get_prompt_ids(
                 initial_prompt, return_tensors="pt"
             ).to(self.device, dtype=torch.long)
 
-            self.gen_config["prompt_ids"] = prompt_ids
-            self.gen_config_save["initial_prompt"] = initial_prompt
-    
-    def _iter_files(self):
-        return self.root.rglob("metadata.parquet")
+            config.generate["prompt_ids"] = prompt_ids
+            config.save["initial_prompt"] = initial_prompt
 
-    def _make_batch(self, subset, suffix, files):
-        return ClipBatch(
-            corpus=self.corpus,
-            subset=subset,
-            suffix=suffix,
-            meta_files=files,
-        )
-    
-    def _collate(self, batch):
-        batch = [b for b in batch if b is not None]
-        if not batch:
-            return None, None
+        if self.pack:
+            config.generate["return_timestamps"] = True
+            config.save["return_timestamps"] = True
 
-        waveforms = [b["waveform"] for b in batch]
-        sr = batch[0]["sampling_rate"]
+        # a temperature schedule is run per sample by _generate_with_fallback
+        # rather than by generate(), which retries the whole batch
+        if isinstance(config.generate.get("temperature"), (list, tuple)):
+            config.temperatures = [
+                float(t) for t in config.generate.pop("temperature")
+            ]
+            config.compression_ratio_threshold = config.generate.pop(
+                "compression_ratio_threshold", None
+            )
+            config.logprob_threshold = config.generate.pop("logprob_threshold", None)
+            if config.generate.pop("no_speech_threshold", None) is not None:
+                warnings.warn(
+                    "no_speech_threshold is ignored by the per-sample "
+                    "temperature fallback"
+                )
+        return config
 
-        inputs = self.processor(
-            waveforms,
-            sampling_rate=sr,
-            return_tensors="pt",
+    def _configs(self) -> list[DecodeConfig]:
+        if self._sweep:
+            return list(self._sweep.values())
+        return [self.decode_config]
+
+    def _heads(self):
+        return list(self._sweep) if self._sweep else [None]
+
+    def _collator(self):
+        return FeatureCollator(
+            self.processor,
+            cache=self.cache,
+            hash_audio=self.encoder_cache is not None,
             return_attention_mask=True,
-            truncation=True
+            truncation=True,
         )
 
-        inputs = {
-            k: v.to(self.device, dtype=self.dtype if k == "input_features" else None)
-            if torch.is_tensor(v) else v
-            for k, v in inputs.items()
-        }
+    def _meta_path(self, config: DecodeConfig, kind: str) -> Path:
+        name = f"{config.name}_" if config.name else ""
+        return self.meta_root / f"{self.corpus}_whisper_{name}{kind}.json"
 
-        return inputs, batch
-    
     def _write_gen_config(self):
-        path = self.meta_root / f"{self.corpus}_whisper_gen_config.json"
-        with open(path, "w") as f:
-            json.dump(self.gen_config_save, f, indent=2)
-    
-    @torch.no_grad()
-    def run(self, dataset_cls, limit: int | None = None):
+        # the same for every data-parallel worker, the first one writes it
+        if self.shard is not None and self.shard[0] != 0:
+            return
+        for config in self._configs():
+            with open(self._meta_path(config, "gen_config"), "w") as f:
+                json.dump(config.save, f, indent=2)
+
+    def _on_run_start(self):
         self._write_gen_config()
-        model_base = self.model.config.name_or_path.split("/")[-1]
+        self._packed = [0, 0]
+        self._encoder_stats = Counter()
+        self._assist_stats = Counter()
+        for config in self._configs():
+            config.fallback_stats = Counter()
 
-        for batch in self.iter_batches():
-            out_dir = self.resolve_out_dir(batch)
-            out_path = out_dir / f"{model_base}_output.{self.out_format}"
+    def _on_run_end(self):
+        clips, windows = self._packed
+        if self.pack and clips:
+            print(
+                f"[PACK] {self.corpus}: {clips} clips in {windows} windows, "
+                f"{clips - windows} encoder calls saved"
+            )
+        if self.encoder_cache is not None:
+            print(
+                f"[ENCODER CACHE] {self.corpus}: "
+                f"hits={self._encoder_stats['hits']} "
+                f"misses={self._encoder_stats['misses']}"
+            )
+        for config in self._configs():
+            if config.temperatures:
+                self._write_fallback_stats(config)
+        if self.draft is not None and self._assist_stats["tokens"]:
+            self._write_assist_stats()
 
-            records = []
+    def _write_assist_stats(self):
+        counts = self._assist_stats
+        stats = assist_stats({
+            "tokens": counts["tokens"],
+            "draft_tokens": counts["draft_calls"],
+            "target_calls": counts["target_calls"],
+            "target_s": counts["target_s"],
+            "draft_s": counts["draft_s"],
+        })
+        path = self.meta_root / f"{self.corpus}_whisper_assist_stats.json"
+        with open(_rank_path(path, self.shard), "w") as f:
+            json.dump(stats, f, indent=2)
+        print(
+            f"[ASSIST] {self.corpus}: acceptance={stats['acceptance_rate']:.2f} "
+            f"tokens/call={counts['tokens'] / counts['target_calls']:.2f} "
+            f"est_speedup={stats['est_speedup']:.2f}x"
+        )
 
-            for meta_path in batch.meta_files:
-                dataset = dataset_cls(meta_path, limit=limit)
+    def _write_fallback_stats(self, config: DecodeConfig):
+        counts = config.fallback_stats
+        stats = {
+            "clips": sum(counts[t] for t in config.temperatures),
+            "temperatures": {str(t): counts[t] for t in config.temperatures},
+            # still failing at the last temperature, kept as decoded there
+            "exhausted": counts["exhausted"],
+        }
+        with open(_rank_path(self._meta_path(config, "fallback_stats"), self.shard), "w") as f:
+            json.dump(stats, f, indent=2)
+        label = f"{self.corpus}/{config.name}" if config.name else self.corpus
+        print(f"[FALLBACK] {label}: {stats['temperatures']} exhausted={stats['exhausted']}")
 
-                loader = DataLoader(
-                    dataset,
-                    batch_size=self.batch_size,
-                    shuffle=False,
-                    collate_fn=self._collate,
-                )
+    def _cache_namespace(self):
+        return {
+            **super()._cache_namespace(),
+            "language": self.language,
+            "gen_config": self.gen_config_save,
+            "pack": self.pack,
+        }
 
-                for inputs, samples in tqdm(
-                    loader,
-                    desc=f"Whisper inference on {self.corpus}",
-                    leave=False,
-                ):
-                    if inputs is None:
-                        continue
-
-                    tokens = self.model.generate(**inputs, **self.gen_config)
-                    if hasattr(tokens, "sequences"):
-                        token_ids = tokens.sequences
-                    else:
-                        token_ids = tokens
-                    token_ids = token_ids.long()
-                    texts = self.processor.batch_decode(
-                        token_ids,
-                        skip_special_tokens=True,
-                        normalize=False,
-                    )
+    def sweep(
+            self,
+            dataset_cls,
+            gen_configs: dict[str, dict],
+            limit: int | None = None) -> list[Path]:
+        """
+        Decode the clips with several gen_configs against one encoder pass
+        per batch. Config name writes {model}_{name}_output and
+        {corpus}_whisper_{name}_gen_config.json.
+        """
+        if self.cache is not None or self.cache_path is not None:
+            raise ValueError("sweep() does not use the result cache, drop cache_path")
+        if self.draft is not None:
+            raise ValueError("sweep() does not use draft_model")
+        self._sweep = {
+            name: self._prepare_gen_config(config, name)
+            for name, config in gen_configs.items()
+        }
+        try:
+            return self.run(dataset_cls, limit=limit)
+        finally:
+            self._sweep = None
 
-                    for sample, text in zip(samples, texts):
-                        records.append(
-                            {
-                                "audio_path": sample["clip_path"],
-                                "prediction": text.strip(),
-                                "transcription": sample.get("transcription"),
-                            }
-                        )
+    def _wrap_dataset(self, dataset):
+        if not self.pack:
+            return dataset
+        packed = PackedClipDataset(dataset)
+        self._packed[0] += packed.num_clips
+        self._packed[1] += len(packed)
+        return packed
 
-            df = pl.DataFrame(records)
+    def _unpack(self, sample, text):
+        if "members" not in sample:
+            yield sample, text
+            return
+        members = sample["members"]
+        texts = split_by_timestamps(
+            text, [(m["start_s"], m["end_s"]) for m in members]
+        )
+        for member, member_text in zip(members, texts):
+            member["part"] = sample["part"]
+            yield member, member_text
 
-            if self.dry_run:
-                print(f"[DRY] {out_path}")
-                print(df)
+    def _forward(self, inputs):
+        hashes = inputs.pop("audio_hashes", None)
+        config = self.decode_config
+        if self.draft is not None:
+            return self._generate_assisted(inputs)
+        if not (self._sweep or config.temperatures or self.encoder_cache):
+            tokens = self.model.generate(**inputs, **self.gen_config)
+            if hasattr(tokens, "sequences"):
+                token_ids = tokens.sequences
+            else:
+                token_ids = tokens
+            return token_ids.long()
+
+        features = inputs["input_features"]
+        hidden = self._encode(features, hashes)
+        mask = inputs.get("attention_mask")
+        outputs = {
+            config.name: self._generate_from_encoder(features, hidden, mask, config)
+            for config in self._configs()
+        }
+        return outputs if self._sweep else outputs[None]
+
+    def _generate_assisted(self, inputs):
+        """
+        Assisted generation one clip at a time (transformers supports batch
+        size 1 only); the model verifies the draft's tokens, so the output
+        is its own greedy output
+        """
+        prefix = self._decoder_prefix(self.decode_config)
+        sequences = []
+        for i in range(inputs["input_features"].shape[0]):
+            # the kwargs of the plain batched call, so the language is
+            # detected per clip unless gen_config sets one
+            tokens = self.model.generate(
+                **{k: v[i:i + 1] for k, v in inputs.items()},
+                **self.gen_config,
+                assistant_model=self.draft,
+            )
+            seq = tokens.sequences if hasattr(tokens, "sequences") else tokens
+            sequences.append(seq[0])
+            # predicted tokens only; the prompt and the special tokens lead
+            # the sequence when generate() returns them at all, and the
+            # transcription may repeat prompt tokens
+            generated = seq[0].tolist()
+            if generated[:len(prefix)] == prefix:
+                generated = generated[len(prefix):]
+            self._assist_stats["tokens"] += len(generated)
+
+        pad = self.processor.tokenizer.eos_token_id
+        return torch.nn.utils.rnn.pad_sequence(
+            sequences, batch_first=True, padding_value=pad
+        ).long()
+
+    def _encode(self, features, hashes: list[str] | None) -> torch.Tensor:
+        """
+        Encoder hidden states, read from and added to the encoder cache
+        """
+        encoder = self.model.get_encoder()
+        if self.encoder_cache is None or hashes is None:
+            return encoder(features).last_hidden_state
+
+        hidden = [self.encoder_cache.get(h) for h in hashes]
+        missing = [i for i, h in enumerate(hidden) if h is None]
+        self._encoder_stats["hits"] += len(hidden) - len(missing)
+        self._encoder_stats["misses"] += len(missing)
+        if missing:
+            fresh = encoder(features[missing]).last_hidden_state
+            for i, state in zip(missing, fresh):
+                # stored at full precision, so hits decode the same states
+                # as misses; numpy has no bfloat16
+                state_np = state.cpu()
+                if state_np.dtype == torch.bfloat16:
+                    state_np = state_np.float()
+                self.encoder_cache.put(hashes[i], state_np.numpy())
+                hidden[i] = state
+        return torch.stack([
+            torch.as_tensor(h).to(self.device, dtype=self.dtype) for h in hidden
+        ])
+
+    def _detect_language(self, encoder_outputs) -> list[str]:
+        lang_ids = self.model.detect_language(encoder_outputs=encoder_outputs)
+        # "<|en|>" -> "en"
+        tokens = self.processor.tokenizer.convert_ids_to_tokens(lang_ids.tolist())
+        return [token[2:-2] for token in tokens]
+
+    def _generate_encoded(
+            self,
+            features,
+            hidden,
+            attention_mask,
+            rows: list[int],
+            config: DecodeConfig,
+            **overrides):
+        kwargs = {**config.generate, **overrides}
+        encoder_outputs = BaseModelOutput(last_hidden_state=hidden[rows])
+        # the language of the plain generate() call: the one in gen_config,
+        # else the detected one; English-only checkpoints take none
+        languages = [kwargs.get("language")] * len(rows)
+        if "language" not in kwargs and self._multilingual:
+            # generate() rejects precomputed encoder output when it detects
+            # the language itself, so detect it the same way here
+            languages = self._detect_language(encoder_outputs)
+            kwargs["language"] = languages
+        if attention_mask is not None:
+            kwargs["attention_mask"] = attention_mask[rows]
+        # features only set the batch shape, the encoder is not rerun
+        tokens = self.model.generate(
+            input_features=features[rows],
+            encoder_outputs=encoder_outputs,
+            **kwargs,
+        )
+        token_ids = tokens.sequences if hasattr(tokens, "sequences") else tokens
+        return encoder_outputs, token_ids, languages
+
+    def _generate_from_encoder(self, features, hidden, attention_mask, config: DecodeConfig):
+        if not config.temperatures:
+            rows = list(range(hidden.shape[0]))
+            return self._generate_encoded(
+                features, hidden, attention_mask, rows, config
+            )[1].long()
+        return self._generate_with_fallback(features, hidden, attention_mask, config)
+
+    def _decoder_prefix(self, config: DecodeConfig, language: str | None = None) -> list[int]:
+        """
+        Tokens the decoder is conditioned on before the transcription, as
+        generate() builds them: language and task only on multilingual
+        checkpoints, no-timestamps unless decoding with timestamps
+        """
+        generation_config = self.model.generation_config
+        prefix = [generation_config.decoder_start_token_id]
+        if self._multilingual and language is not None:
+            task = config.generate.get("task") or "transcribe"
+            prefix += [self._language_id(language), generation_config.task_to_id[task]]
+        if not config.generate.get("return_timestamps"):
+            prefix.append(generation_config.no_timestamps_token_id)
+        if "prompt_ids" in config.generate:
+            prefix = config.generate["prompt_ids"].tolist() + prefix
+        return prefix
+
+    def _language_id(self, language: str) -> int:
+        # "english", "en" or "<|en|>", as generate() takes them
+        if not language.startswith("<|"):
+            language = language.lower()
+            language = f"<|{TO_LANGUAGE_CODE.get(language, language)}|>"
+        return self.model.generation_config.lang_to_id[language]
+
+    def _avg_logprobs(
+            self,
+            encoder_outputs,
+            token_ids,
+            languages: list[str | None],
+            config: DecodeConfig) -> torch.Tensor:
+        """
+        Mean log-probability of each transcription plus end-of-text, scored
+        by one decoder pass over the cached encoder output with the prefix
+        it was decoded with
+        """
+        tokenizer = self.processor.tokenizer
+        eot = tokenizer.eos_token_id
+        timestamp_begin = tokenizer.convert_tokens_to_ids("<|notimestamps|>") + 1
+        prefixes = [self._decoder_prefix(config, language) for language in languages]
+
+        rows = [
+            prefix
+            + [t for t in seq.tolist() if t < eot or t >= timestamp_begin]
+            + [eot]
+            for prefix, seq in zip(prefixes, token_ids)
+        ]
+        lengths = torch.tensor([len(r) for r in rows])
+        decoder_ids = torch.full((len(rows), int(lengths.max())), eot)
+        for i, row in enumerate(rows):
+            decoder_ids[i, :len(row)] = torch.tensor(row)
+        decoder_ids = decoder_ids.to(self.device)
+
+        logits = self.model(
+            encoder_outputs=encoder_outputs, decoder_input_ids=decoder_ids
+        ).logits.float()
+        logprobs = torch.log_softmax(logits[:, :-1], dim=-1).gather(
+            -1, decoder_ids[:, 1:, None]
+        ).squeeze(-1).cpu()
+
+        positions = torch.arange(logprobs.shape[1])
+        starts = torch.tensor([len(p) for p in prefixes])
+        scored = (positions >= starts[:, None] - 1) & (positions < lengths[:, None] - 1)
+        return (logprobs * scored).sum(1) / scored.sum(1)
+
+    def _needs_fallback(
+            self,
+            encoder_outputs,
+            token_ids,
+            languages: list[str | None],
+            config: DecodeConfig) -> list[bool]:
+        texts = self.processor.batch_decode(token_ids, skip_special_tokens=True)
+        failed = [False] * len(texts)
+        if config.compression_ratio_threshold is not None:
+            failed = [
+                f or compression_ratio(text) > config.compression_ratio_threshold
+                for f, text in zip(failed, texts)
+            ]
+        if config.logprob_threshold is not None:
+            avg = self._avg_logprobs(encoder_outputs, token_ids, languages, config)
+            failed = [
+                f or lp < config.logprob_threshold
+                for f, lp in zip(failed, avg.tolist())
+            ]
+        return failed
+
+    def _generate_with_fallback(self, features, hidden, attention_mask, config: DecodeConfig):
+        """
+        Decode at the first temperature, then re-decode only the samples
+        that fail the compression ratio or logprob thresholds at the next
+        one, reusing the encoder output
+        """
+        final: list[torch.Tensor | None] = [None] * hidden.shape[0]
+        todo = list(range(hidden.shape[0]))
+
+        for i, temperature in enumerate(config.temperatures):
+            if temperature > 0:
+                # sampling as in Whisper's fallback, one candidate per clip
+                overrides = dict(do_sample=True, temperature=temperature, num_beams=1)
             else:
-                if self.out_format == "parquet":
-                    df.write_parquet(out_path)
-                elif self.out_format == "csv":
-                    df.write_csv(out_path)
-                elif self.out_format == "jsonl":
-                    df.write_ndjson(out_path)
\ No newline at end of file
+                overrides = dict(do_sample=False)
+            encoder_outputs, token_ids, languages = self._generate_encoded(
+                features, hidden, attention_mask, todo, config, **overrides
+            )
+
+            failed = self._needs_fallback(encoder_outputs, token_ids, languages, config)
+            last = i == len(config.temperatures) - 1
+            retry = []
+            for idx, seq, fail in zip(todo, token_ids, failed):
+                final[idx] = seq
+                if not fail:
+                    config.fallback_stats[temperature] += 1
+                elif last:
+                    config.fallback_stats[temperature] += 1
+                    config.fallback_stats["exhausted"] += 1
+                else:
+                    retry.append(idx)
+            todo = retry
+            if not todo:
+                break
+
+        pad = self.processor.tokenizer.eos_token_id
+        return torch.nn.utils.rnn.pad_sequence(
+            final, batch_first=True, padding_value=pad
+        ).long()
+
+    def _decode(self, token_ids):
+        if isinstance(token_ids, dict):
+            return {name: self._decode(ids) for name, ids in token_ids.items()}
+        return self.processor.batch_decode(
+            token_ids,
+            skip_special_tokens=True,
+            normalize=False,
+            decode_with_timestamps=self.pack,
+        )
+
+    def _make_record(self, sample, text):
+        return {
+            "audio_path": sample["clip_path"],
+            "prediction": text.strip(),
+            "transcription": sample.get("transcription"),
+        }
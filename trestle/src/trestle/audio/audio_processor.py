@@ -1,14 +1,34 @@
+import bisect
+from functools import partial
 from multiprocessing import Pool, cpu_count
 from pathlib import Path
 from typing import Any, Literal
 from dataclasses import dataclass
 from tqdm import tqdm
+import time
+import numpy as np
 import torchaudio
-from torch.utils.data import Dataset
-import torchaudio
+from torch.utils.data import ConcatDataset, DataLoader, Dataset
 import polars as pl
 from trestle.io import BatchWrapperBase
-from trestle.io.audio_utils import clip_audio_batch
+from trestle.io.table_writer import ChunkedTableWriter, read_table, write_table
+from trestle.io.clip_index import CostEstimate, DEFAULT_RTF
+from trestle.io.audio_utils import (
+    ClipJob, ClipShardWriter, clip_audio_batch,
+    open_wav_memmap, read_wav_header, wav_frames_to_tensor,
+)
+from trestle.audio.vad import (
+    VAD_COLUMNS, VADConfig, apply_segments, format_vad_report, speech_segments,
+)
+
+# bytes written per second of 16 kHz audio: clips are float32 .wav files,
+# shards hold int16 samples and virtual clips write no audio
+STORE_BYTES_PER_SECOND = {
+    "wav": 16_000 * 4,
+    "shard": 16_000 * 2,
+    "virtual": 0,
+}
+WAV_HEADER_BYTES = 44
 
 @dataclass
 class AudioClipBatch:
@@ -28,8 +48,41 @@ class AudioClipper(BatchWrapperBase):
             out_root: Path,
             dry_run: bool=False,
             mode: Literal["full", "task"] = "task",
-            num_worksers: int=2,
-            format: str='parquet'):
+            num_workers: int | None=1,
+            format: str='parquet',
+            decode_once: bool=False,
+            chunksize: int=1,
+            clip_store: Literal["wav", "virtual", "shard"] = "wav",
+            shard_size_mb: int=512,
+            resume: bool=False,
+            flush_every: int=1000,
+            est_rtf: float | None=None,
+            vad: VADConfig | None=None,
+            num_worksers: int | None=None):
+        """
+        num_workers: processes clipping recordings in parallel, None uses all
+                     cores and 1 keeps the serial path
+        decode_once: open each source recording once (memory-mapped when it is
+                     a PCM wav) and slice all of its clips from that buffer
+        chunksize: recordings handed to a worker at a time
+        clip_store: "wav" writes one file per clip; "virtual" writes metadata
+                    only (start_frame, end_frame, sample_rate) and lets
+                    AudioClipDataset slice the source recording; "shard"
+                    packs clips into a few large int16 wav shards under
+                    shards/, read back with ShardedClipDataset
+        shard_size_mb: maximum size of one shard file
+        resume: keep .wav clips that already exist with the expected length and
+                rebuild their metadata rows without cutting them again;
+                recordings whose rows an interrupted run already flushed to
+                metadata.{format}.parts are not opened at all
+        flush_every: metadata rows buffered before a chunk is written to
+                     metadata.{format}.parts, merged once the batch finishes
+        est_rtf: processing seconds per audio second used by dry_run to
+                 estimate the runtime
+        vad: trim silence from the clips once they are cut, see
+             trim_metadata; parquet metadata only
+        num_worksers: deprecated alias of num_workers
+        """
         super().__init__(
             corpus=corpus,
             root=Path(text_root) / corpus,
@@ -37,9 +90,23 @@ class AudioClipper(BatchWrapperBase):
             modality_dir='clips'
         )
         self.mode=mode
-        self.num_workers = num_worksers
+        if num_worksers is not None:
+            num_workers = num_worksers
+        self.num_workers = num_workers or cpu_count()
+        self.chunksize = chunksize
         self.dry_run = dry_run
         self.format = format
+        self.decode_once = decode_once
+        if clip_store not in ("wav", "virtual", "shard"):
+            raise ValueError(f"Unknown clip_store '{clip_store}'")
+        self.clip_store = clip_store
+        self.shard_size_mb = shard_size_mb
+        self.resume = resume
+        self.flush_every = flush_every
+        self.est_rtf = est_rtf if est_rtf is not None else DEFAULT_RTF["clip"]
+        if vad is not None and format != "parquet":
+            raise ValueError("vad trimming needs parquet metadata")
+        self.vad = vad
     
     def _iter_files(self):
         if not self.root.exists():
@@ -75,64 +142,220 @@ class AudioClipper(BatchWrapperBase):
             text_files=files,
         )
 
+    def _clip(self, jobs):
+        """
+        Yield the records of each recording job, in job order
+        """
+        worker = partial(
+            clip_audio_batch,
+            decode_once=self.decode_once,
+            store=self.clip_store,
+            skip_existing=self.resume,
+        )
+        if self.num_workers == 1:
+            for job in jobs:
+                yield worker(job)
+            return
+
+        with Pool(processes=self.num_workers) as pool:
+            yield from pool.imap(worker, jobs, chunksize=self.chunksize)
+
+    def _plan_jobs(self, batch, out_dir: Path) -> list[ClipJob]:
+        """
+        Group the utterances of a batch by source recording.
+        Clips keep the order of the text files, sorted by start within each.
+        """
+        frames = []
+        for text_file in batch.text_files:
+            task = text_file.stem.split("_")[0]
+            frames.append(
+                read_table(text_file, self.format)
+                .sort("start")
+                .select(
+                    "pid", "text", "start", "end", "audio_path",
+                    task=pl.lit(task),
+                )
+            )
+        if not frames:
+            return []
+
+        df = pl.concat(frames, how="vertical_relaxed").filter(
+            pl.col("audio_path").is_not_null()
+        )
+
+        # one existence check per recording
+        sources = df["audio_path"].unique().to_list()
+        existing = [src for src in sources if Path(src).exists()]
+
+        by_source = (
+            df
+            .filter(pl.col("audio_path").is_in(existing))
+            .select(
+                "audio_path", "pid", "text", "start", "end",
+                # {task}_{pid}_{start}_{end}.wav, with a missing value
+                # written as "None" like the names of existing clip trees
+                clip_path=pl.concat_str(
+                    pl.lit(f"{out_dir}/"), "task",
+                    pl.lit("_"), pl.col("pid").cast(pl.String).fill_null("None"),
+                    pl.lit("_"), pl.col("start").cast(pl.String).fill_null("None"),
+                    pl.lit("_"), pl.col("end").cast(pl.String).fill_null("None"),
+                    pl.lit(".wav"),
+                ),
+            )
+            .partition_by(
+                "audio_path",
+                maintain_order=True,
+                include_key=False,
+                as_dict=True,
+            )
+        )
+
+        return [
+            ClipJob(src=Path(src), clips=clips)
+            for (src,), clips in by_source.items()
+        ]
+
+    def _resume_parts(self, writer: ChunkedTableWriter, jobs: list[ClipJob]) -> list[ClipJob]:
+        """
+        With resume, keep the parts an interrupted run flushed and drop the
+        recordings they cover; a recording's rows always land in one part.
+        Shards are rewritten from scratch, so their parts are cleared.
+        """
+        parts = writer.read_parts() if self.resume else None
+        if parts is None or self.clip_store == "shard":
+            writer.clear()
+            return jobs
+
+        done = set(parts["source_audio"].unique().to_list())
+        remaining = [job for job in jobs if str(job.src) not in done]
+        print(
+            f"[RESUME] {self.corpus}: {len(jobs) - len(remaining)} recordings "
+            f"({parts.height} clips) recovered from {writer.parts_dir.name}"
+        )
+        return remaining
+
     def run(self):
         for batch in self.iter_batches():
             out_dir = self.resolve_out_dir(batch)
             out_dir.mkdir(parents=True, exist_ok=True)
 
             meta_path = out_dir / f"metadata.{self.format}"
-            audio_jobs: dict[Path, list[dict[str, Any]]] = {}
-
-            for text_file in batch.text_files:
-                task = text_file.stem.split("_")[0]
-                df = pl.read_parquet(text_file).sort("start")
-
-                for n, row in enumerate(df.iter_rows(named=True)):
-                    src = Path(row["audio_path"])
-                    if not src.exists():
-                        continue
-
-                    clip_path = out_dir / f"{task}_{row['pid']}_{row['start']}_{row['end']}.wav"
-
-                    audio_jobs.setdefault(src, []).append({
-                        "pid": row["pid"],
-                        "text": row["text"],
-                        "start": row["start"],
-                        "end": row["end"],
-                        "clip_path": clip_path,
-                    })
+            audio_jobs = self._plan_jobs(batch, out_dir)
 
             if self.dry_run:
-                num_clips = sum(len(clips) for clips in audio_jobs.values())
-                num_recordings = len(audio_jobs)
+                # planned clip lengths, no audio is opened
+                durations = pl.Series("duration_ms", [], dtype=pl.Int64)
+                if audio_jobs:
+                    clips = pl.concat([job.clips for job in audio_jobs])
+                    durations = (clips["end"] - clips["start"]).clip(0)
+                num_clips = len(durations)
+                header_bytes = 0
+                if self.clip_store == "wav":
+                    header_bytes = WAV_HEADER_BYTES * num_clips
+                estimate = CostEstimate.from_durations(
+                    clips=num_clips,
+                    durations_ms=durations,
+                    bytes_per_second=STORE_BYTES_PER_SECOND[self.clip_store],
+                    rtf=self.est_rtf,
+                    fixed_bytes=header_bytes,
+                )
                 print(
                     f"[DRY RUN] corpus={self.corpus}\n"
                     f"mode={self.mode}\n"
-                    f"recordings={num_recordings}\n"
-                    f"clips={num_clips}\n"
+                    f"clip_store={self.clip_store}\n"
+                    f"recordings={len(audio_jobs)}\n"
+                    f"{estimate}"
                     f"output_dir={out_dir}\n"
                 )
                 continue
 
-            records: list[dict[str, Any]] = []
-            for job in tqdm(
-                audio_jobs.items(),
+            shards = None
+            if self.clip_store == "shard":
+                shards = ClipShardWriter(
+                    out_dir / "shards", self.shard_size_mb * 1024 * 1024
+                )
+
+            writer = ChunkedTableWriter(
+                meta_path, format=self.format, flush_every=self.flush_every
+            )
+            audio_jobs = self._resume_parts(writer, audio_jobs)
+
+            for batch_records in tqdm(
+                self._clip(audio_jobs),
                 total=len(audio_jobs),
                 desc=f"Clipping audio ({self.corpus})",
             ):
-                batch_records = clip_audio_batch(job)
-                records.extend(batch_records)
+                if shards is not None:
+                    for record in batch_records:
+                        shard, start, end = shards.write(
+                            record.pop("audio"), record["sample_rate"]
+                        )
+                        record.update(
+                            shard=shard, start_frame=start, end_frame=end
+                        )
+                writer.write(batch_records)
+
+            if shards is not None:
+                shards.close()
+
+            writer.finalize()
 
-            if records:
-                meta_df = pl.DataFrame(records)
+            if self.vad is not None:
+                stats = trim_metadata(
+                    meta_path, self.vad,
+                    num_workers=self.num_workers if self.num_workers > 1 else 0,
+                )
+                print(format_vad_report(f"{self.corpus}/{out_dir.name}", stats))
 
-                if self.format == "parquet":
-                    meta_df.write_parquet(meta_path)
-                elif self.format == "jsonl":
-                    meta_df.write_ndjson(meta_path)
-                elif self.format == "csv":
-                    meta_df.write_csv(meta_path)
-		
+
+def trim_metadata(
+        meta_path: Path,
+        config: VADConfig | None = None,
+        root: Path | None = None,
+        num_workers: int = 0) -> dict:
+    """
+    Run the VAD over every clip of a metadata file and add vad_starts and
+    vad_ends (sample offsets of the kept parts inside the clip) and
+    vad_num_frames to it; AudioClipDataset then reads the trimmed clips.
+    Returns the audio seconds before and after trimming.
+
+    num_workers: DataLoader workers decoding clips and running the VAD;
+                 0 runs it in this process
+    """
+    config = config or VADConfig()
+    dataset = _SegmentDataset(meta_path, config, root=root)
+    # every clip of the file, not only those of one subset
+    dataset.df = pl.read_parquet(meta_path).with_row_index("_row")
+    # one clip per item, in metadata order; only the offsets come back
+    loader = DataLoader(
+        dataset, batch_size=None, num_workers=num_workers, collate_fn=_no_collate
+    )
+
+    starts, ends, kept = [], [], []
+    stats = {"clips": len(dataset), "audio_s": 0.0, "kept_s": 0.0, "untrimmed": 0}
+    for item in loader:
+        if item is None:
+            # undecodable clips are left as they are
+            starts.append(None)
+            ends.append(None)
+            kept.append(None)
+            continue
+        num_samples, sr, segments = item
+        num_frames = int((segments[:, 1] - segments[:, 0]).sum())
+        starts.append(segments[:, 0].tolist())
+        ends.append(segments[:, 1].tolist())
+        kept.append(num_frames)
+        stats["audio_s"] += num_samples / sr
+        stats["kept_s"] += num_frames / sr
+        stats["untrimmed"] += num_frames == num_samples
+
+    df = pl.read_parquet(meta_path).drop(VAD_COLUMNS, strict=False).with_columns(
+        pl.Series("vad_starts", starts, dtype=pl.List(pl.Int64)),
+        pl.Series("vad_ends", ends, dtype=pl.List(pl.Int64)),
+        pl.Series("vad_num_frames", kept, dtype=pl.Int64),
+    )
+    write_table(df, meta_path, "parquet")
+    return stats
 
 
 class AudioClipDataset(Dataset):
@@ -141,16 +364,22 @@ class AudioClipDataset(Dataset):
         meta_path: Path,
         root: Path | None = None,
         subset: str | None = None,
-        limit: int | None = None
+        limit: int | None = None,
+        vad: VADConfig | None = None,
+        apply_trim: bool = True
     ):
         """
         meta_path: path to metadata.parquet
         root: base dir for relative clip_path (defaults to meta_path parent)
         return_text: return reference text if available
+        vad: trim clips on the fly (in the DataLoader workers) when the
+             metadata has no trim offsets
+        apply_trim: cut clips to the offsets written by trim_metadata
         """
         self.meta_path = Path(meta_path)
         self.root = root or self.meta_path.parent
-        df = pl.read_parquet(self.meta_path)
+        # row in the metadata file, stable under filtering and reordering
+        df = pl.read_parquet(self.meta_path).with_row_index("_row")
 
         if subset is None:
             subset = self.meta_path.parent.name
@@ -163,24 +392,295 @@ class AudioClipDataset(Dataset):
             df = df.head(limit)
 
         self.df = df
+        # virtual and sharded clips are sliced from a larger recording
+        self.virtual = "start_frame" in df.columns
+        self.source_col = "shard" if "shard" in df.columns else "source_audio"
+        self._sources: dict[str, Any] = {}
+        self.trimmed = apply_trim and "vad_starts" in df.columns
+        self.vad = vad
+
+    def __getstate__(self):
+        # memory maps are reopened lazily in each DataLoader worker
+        state = self.__dict__.copy()
+        state["_sources"] = {}
+        return state
 
     def __len__(self):
         return self.df.height
-    
+
+    def clip_paths(self) -> pl.Series:
+        """
+        Resolved clip paths, as reported in sample["clip_path"]
+        """
+        return self.df["clip_path"].map_elements(
+            lambda p: str(self.root / p), return_dtype=pl.String
+        )
+
+    def exclude(self, clip_paths: set[str]):
+        """
+        Drop clips whose resolved path is in clip_paths
+        """
+        if clip_paths:
+            keep = ~self.clip_paths().is_in(list(clip_paths))
+            self.df = self.df.filter(keep)
+
+    def shard(self, rank: int, num_shards: int):
+        """
+        Keep the rank-th of num_shards contiguous blocks of clips
+        """
+        block = pl.int_range(pl.len()) * num_shards // pl.len()
+        self.df = self.df.filter(block == rank)
+
+    def clip_lengths(self) -> np.ndarray:
+        """
+        Number of frames per clip (after trimming), from the metadata index
+        when available and otherwise from the clip file headers
+        """
+        if self.trimmed:
+            trimmed = self.df["vad_num_frames"].fill_null(-1).to_numpy()
+            if (trimmed >= 0).all():
+                return trimmed
+            return np.where(trimmed >= 0, trimmed, self._untrimmed_lengths())
+        return self._untrimmed_lengths()
+
+    def _untrimmed_lengths(self) -> np.ndarray:
+        if "num_frames" in self.df.columns:
+            return self.df["num_frames"].to_numpy()
+        if self.virtual:
+            return (self.df["end_frame"] - self.df["start_frame"]).to_numpy()
+
+        lengths = []
+        for clip_path in self.df["clip_path"]:
+            try:
+                header = read_wav_header(self.root / clip_path)
+            except OSError:
+                header = None
+            lengths.append(header.num_frames if header else 0)
+        return np.asarray(lengths)
+
+    def _open(self, src):
+        if src not in self._sources:
+            self._sources[src] = open_wav_memmap(src)
+        return self._sources[src]
+
+    def _load_virtual(self, row):
+        src = row[self.source_col]
+        start, end = row["start_frame"], row["end_frame"]
+        mapped = self._open(src)
+
+        if mapped is None:
+            return torchaudio.load(
+                src, frame_offset=start, num_frames=end - start
+            )
+
+        samples, sr = mapped
+        return wav_frames_to_tensor(samples[start:end]), sr
+
     def __getitem__(self, idx):
         row = self.df.row(idx, named=True)
         audio_path = self.root / row["clip_path"]
+        start = time.perf_counter()
         try:
-            waveform, sr = torchaudio.load(audio_path)
-        except RuntimeError:
+            if self.virtual:
+                waveform, sr = self._load_virtual(row)
+            else:
+                waveform, sr = torchaudio.load(audio_path)
+        except (RuntimeError, OSError):
             print(f"Decode failed: {audio_path}")
             return None
 
+        waveform = waveform.squeeze(0).numpy()
+        if self.trimmed and row["vad_starts"] is not None:
+            waveform = apply_segments(waveform, row["vad_starts"], row["vad_ends"])
+        elif self.vad is not None:
+            segments = speech_segments(waveform, sr, self.vad)
+            waveform = apply_segments(waveform, segments[:, 0], segments[:, 1])
+
         sample = {
-            "waveform": waveform.squeeze(0).numpy(),
+            "waveform": waveform,
             "sampling_rate": sr,
             "clip_path": str(audio_path),
             "transcription": row.get("text"),
+            "index": idx,
+            "row": row["_row"],
+            "decode_s": time.perf_counter() - start,
         }
 
-        return sample
\ No newline at end of file
+        return sample
+
+
+class _SegmentDataset(AudioClipDataset):
+    """
+    Untrimmed clips reduced to (num_samples, sampling_rate, speech segments)
+    for trim_metadata
+    """
+    def __init__(self, meta_path: Path, config: VADConfig, root: Path | None = None):
+        super().__init__(meta_path, root=root, apply_trim=False)
+        self.config = config
+
+    def __getitem__(self, idx):
+        sample = super().__getitem__(idx)
+        if sample is None:
+            return None
+        waveform, sr = sample["waveform"], sample["sampling_rate"]
+        return len(waveform), sr, speech_segments(waveform, sr, self.config)
+
+
+def _no_collate(item):
+    return item
+
+
+class ShardedClipDataset(AudioClipDataset):
+    """
+    Read clips packed by AudioClipper(clip_store="shard") in shard order.
+    The max_open most recently used shards stay mapped, so samplers that
+    interleave shards (length buckets, several DataLoader workers) do not
+    remap them on every clip, and the kernel is told to read them ahead
+    sequentially.
+    """
+    def __init__(
+        self,
+        meta_path: Path,
+        root: Path | None = None,
+        subset: str | None = None,
+        limit: int | None = None,
+        vad: VADConfig | None = None,
+        apply_trim: bool = True,
+        max_open: int = 4
+    ):
+        super().__init__(
+            meta_path, root=root, subset=subset, limit=limit,
+            vad=vad, apply_trim=apply_trim,
+        )
+        if "shard" not in self.df.columns:
+            raise ValueError(f"{self.meta_path} has no shard column")
+        self.df = self.df.sort(["shard", "start_frame"], maintain_order=True)
+        self.max_open = max_open
+
+    def _open(self, src):
+        # dicts keep insertion order: the first key is the least recently used
+        if src in self._sources:
+            self._sources[src] = self._sources.pop(src)
+        else:
+            if len(self._sources) >= self.max_open:
+                del self._sources[next(iter(self._sources))]
+            self._sources[src] = open_wav_memmap(src, sequential=True)
+        return self._sources[src]
+
+
+class ConcatClipDataset(ConcatDataset):
+    """
+    Several clip datasets read as one, so batches span metadata files.
+    Each sample gets "part" (which dataset it came from) and a global
+    "index" that preserves the order of the parts.
+    """
+    def __getitem__(self, idx):
+        part = bisect.bisect_right(self.cumulative_sizes, idx)
+        offset = self.cumulative_sizes[part - 1] if part else 0
+        sample = self.datasets[part][idx - offset]
+        if sample is not None:
+            sample["index"] = idx
+            sample["part"] = part
+        return sample
+
+    def clip_lengths(self) -> np.ndarray:
+        for dataset in self.datasets:
+            if not hasattr(dataset, "clip_lengths"):
+                raise TypeError(
+                    f"{type(dataset).__name__} has no clip_lengths(), "
+                    "required for length-bucketed batching"
+                )
+        return np.concatenate([
+            np.asarray(dataset.clip_lengths(), dtype=np.int64)
+            for dataset in self.datasets
+        ])
+
+
+class PackedClipDataset(Dataset):
+    """
+    Consecutive clips from the same source recording joined into windows
+    of at most max_seconds (Whisper pads every input to 30 s anyway), with
+    gap_seconds of silence between them. Each sample keeps its clips under
+    "members" with their "start_s"/"end_s" inside the window.
+    """
+    def __init__(
+        self,
+        dataset: AudioClipDataset,
+        max_seconds: float = 30.0,
+        gap_seconds: float = 0.5
+    ):
+        self.dataset = dataset
+        self.max_seconds = max_seconds
+        self.gap_seconds = gap_seconds
+        df = dataset.df
+        if "sample_rate" in df.columns:
+            rates = df["sample_rate"].to_numpy()
+        else:
+            rates = np.full(df.height, 16_000)
+        self.seconds = np.asarray(dataset.clip_lengths()) / rates
+        self.sample_rate = int(rates[0]) if df.height else 16_000
+        if "source_audio" in df.columns:
+            sources = df["source_audio"].to_list()
+        else:
+            sources = [None] * df.height
+        self.windows = self._pack(sources)
+
+    def _pack(self, sources) -> list[list[int]]:
+        windows: list[list[int]] = []
+        window: list[int] = []
+        length = 0.0
+        for idx, (source, seconds) in enumerate(zip(sources, self.seconds)):
+            extra = seconds + (self.gap_seconds if window else 0.0)
+            if window and (
+                source != sources[window[-1]]
+                or length + extra > self.max_seconds
+            ):
+                windows.append(window)
+                window, length, extra = [], 0.0, seconds
+            window.append(idx)
+            length += extra
+        if window:
+            windows.append(window)
+        return windows
+
+    @property
+    def num_clips(self) -> int:
+        return len(self.seconds)
+
+    def __len__(self):
+        return len(self.windows)
+
+    def clip_lengths(self) -> np.ndarray:
+        gaps = self.gap_seconds * np.array([len(w) - 1 for w in self.windows])
+        seconds = np.array([self.seconds[w].sum() for w in self.windows]) + gaps
+        return (seconds * self.sample_rate).astype(np.int64)
+
+    def __getitem__(self, idx):
+        members = [self.dataset[i] for i in self.windows[idx]]
+        members = [m for m in members if m is not None]
+        if not members:
+            return None
+
+        sr = members[0]["sampling_rate"]
+        gap = np.zeros(int(self.gap_seconds * sr), dtype=np.float32)
+        pieces = []
+        offset = 0.0
+        for member in members:
+            if pieces:
+                pieces.append(gap)
+                offset += self.gap_seconds
+            waveform = member.pop("waveform")
+            pieces.append(waveform)
+            member["start_s"] = offset
+            offset += len(waveform) / sr
+            member["end_s"] = offset
+
+        return {
+            "waveform": np.concatenate(pieces),
+            "sampling_rate": sr,
+            "clip_path": members[0]["clip_path"],
+            "transcription": None,
+            "members": members,
+            "index": idx,
+            "decode_s": sum(m["decode_s"] for m in members),
+        }
@@ -1,9 +1,15 @@
+import os
+import shutil
 import warnings
+from multiprocessing import Pool
 from tqdm import tqdm
 from dataclasses import dataclass
 from pathlib import Path
-from pydub import AudioSegment
+import polars as pl
 from trestle.io import BatchWrapperBase
+from trestle.io.audio_utils import (
+    ConvertJob, convert_audio_file, hash_file, RESAMPLE_BACKENDS
+)
 warnings.filterwarnings('ignore')
 
 @dataclass
@@ -13,6 +19,17 @@ class AudioBatch:
     suffix: str | None
     audio_files: list[Path]
 
+MANIFEST_SCHEMA = {
+    "source_path": pl.String,
+    "out_path": pl.String,
+    "size": pl.Int64,
+    "mtime_ns": pl.Int64,
+    "content_hash": pl.String,
+    "target_sr": pl.Int64,
+    "target_format": pl.String,
+    "backend": pl.String,
+}
+
 class AudioWrapper(BatchWrapperBase):
     def __init__(
         self,
@@ -23,7 +40,21 @@ class AudioWrapper(BatchWrapperBase):
         target_format: str = "wav",
         target_sr: int = 16_000,
         dry_run: bool = False,
+        num_workers: int = 1,
+        backend: str = "pydub",
+        incremental: bool = True,
+        hash_content: bool = False,
+        chunk_seconds: float = 30.0,
     ):
+        """
+        incremental: skip recordings already converted with the same settings,
+                     tracked by a manifest under out_root/corpus
+        hash_content: when size/mtime changed, compare content hashes before
+                      re-converting (e.g. files touched by a copy or sync)
+        chunk_seconds: chunk length for the "stream" backend, which pipes
+                       the recording through ffmpeg and keeps memory
+                       constant for long recordings
+        """
         super().__init__(
             corpus=corpus,
             root=audio_root,
@@ -34,7 +65,23 @@ class AudioWrapper(BatchWrapperBase):
         self.target_format = target_format
         self.target_sr = target_sr
         self.dry_run = dry_run
-        
+        self.num_workers = max(1, num_workers)
+        if backend not in RESAMPLE_BACKENDS:
+            raise ValueError(
+                f"Unknown backend '{backend}', "
+                f"expected one of {sorted(RESAMPLE_BACKENDS)}"
+            )
+        if backend == "stream" and target_format != "wav":
+            raise ValueError("stream backend only supports target_format='wav'")
+        if backend == "stream" and shutil.which("ffmpeg") is None:
+            raise RuntimeError("stream backend needs the ffmpeg binary on PATH")
+        self.backend = backend
+        self.chunk_seconds = chunk_seconds
+        self.incremental = incremental
+        self.hash_content = hash_content
+        self.manifest_path = (
+            self.out_root / self.corpus / "conversion_manifest.parquet"
+        )
 
     def _iter_files(self):
         return self.root.rglob(f"*.{self.source_format}")
@@ -49,31 +96,149 @@ class AudioWrapper(BatchWrapperBase):
             audio_files=audio_files,
         )
 
+    def _load_manifest(self) -> dict[str, dict]:
+        if not self.incremental or not self.manifest_path.exists():
+            return {}
+        df = pl.read_parquet(self.manifest_path)
+        return {row["source_path"]: row for row in df.iter_rows(named=True)}
+
+    def _write_manifest(self, manifest: dict[str, dict]):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".parquet.tmp")
+        pl.DataFrame(
+            list(manifest.values()), schema=MANIFEST_SCHEMA
+        ).write_parquet(tmp_path)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _manifest_entry(self, src: Path, out_path: Path, entry: dict | None):
+        """
+        Build the manifest entry for src, reusing the hash from a previous
+        entry when size and mtime did not change
+        """
+        stat = src.stat()
+        new = {
+            "source_path": str(src),
+            "out_path": str(out_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "content_hash": None,
+            "target_sr": self.target_sr,
+            "target_format": self.target_format,
+            "backend": self.backend,
+        }
+        if self.hash_content:
+            if entry and all(
+                entry[k] == new[k] for k in ("size", "mtime_ns")
+            ):
+                new["content_hash"] = entry["content_hash"]
+            else:
+                new["content_hash"] = hash_file(src)
+        return new
+
+    @staticmethod
+    def _is_current(entry: dict | None, new: dict) -> bool:
+        if entry is None or not Path(new["out_path"]).exists():
+            return False
+        keys = ["out_path", "size", "target_sr", "target_format", "backend"]
+        if new["content_hash"] is not None and entry["content_hash"]:
+            keys.append("content_hash")
+        else:
+            keys.append("mtime_ns")
+        return all(entry[k] == new[k] for k in keys)
+
+    def _remove_orphans(self, manifest: dict[str, dict], seen: set[str]):
+        """
+        Drop outputs whose source recording no longer exists
+        """
+        orphans = [src for src in manifest if src not in seen]
+        for src in orphans:
+            out_path = Path(manifest[src]["out_path"])
+            if self.dry_run:
+                print(f"[DRY] remove orphan {out_path}")
+                continue
+            out_path.unlink(missing_ok=True)
+            del manifest[src]
+        return len(orphans)
+
+    def _convert(self, jobs):
+        """
+        Yield (src, error) per job, serially or over a process pool
+        """
+        if self.num_workers == 1:
+            for job in jobs:
+                yield convert_audio_file(job)
+            return
+
+        with Pool(processes=self.num_workers) as pool:
+            yield from pool.imap_unordered(convert_audio_file, jobs)
+
     def run(self):
+        manifest = self._load_manifest()
+        seen: set[str] = set()
+
         for batch in self.iter_batches():
             out_dir = self.resolve_out_dir(batch)
             out_dir.mkdir(parents=True, exist_ok=True)
 
-            for src in tqdm(batch.audio_files, desc="Processing audio"):
+            jobs = []
+            pending: dict[Path, dict] = {}
+            skipped = 0
+            for src in batch.audio_files:
                 out_path = out_dir / src.with_suffix(
                     f".{self.target_format}"
                 ).name
+                seen.add(str(src))
+
+                if self.incremental:
+                    entry = manifest.get(str(src))
+                    new = self._manifest_entry(src, out_path, entry)
+                    if self._is_current(entry, new):
+                        manifest[str(src)] = new
+                        skipped += 1
+                        continue
+                    pending[src] = new
 
                 if self.dry_run:
                     print(f"[DRY] {src} -> {out_path}")
                     continue
 
-                audio = AudioSegment.from_file(src)
+                jobs.append(ConvertJob(
+                    src=src,
+                    out_path=out_path,
+                    target_sr=self.target_sr,
+                    target_format=self.target_format,
+                    backend=self.backend,
+                    chunk_seconds=self.chunk_seconds,
+                ))
+
+            if skipped:
+                print(f"[SKIP] {skipped} unchanged files in {out_dir}")
+
+            if not jobs:
+                continue
+
+            failed = 0
+            for src, error in tqdm(
+                self._convert(jobs),
+                total=len(jobs),
+                desc="Processing audio",
+            ):
+                if error is not None:
+                    failed += 1
+                    print(f"[FAIL] {src}: {error}")
+                    manifest.pop(str(src), None)
+                elif self.incremental:
+                    manifest[str(src)] = pending[src]
 
-                # convert to mono
-                if audio.channels > 1:
-                    audio = audio.set_channels(1)
-                
-                if src.suffix.lower() == ".mp3":
-                    audio = audio.set_sample_width(2)
+            if failed:
+                print(f"[WARN] {failed}/{len(jobs)} files failed in {out_dir}")
 
-                # resample
-                if audio.frame_rate != self.target_sr:
-                    audio = audio.set_frame_rate(self.target_sr)
+            if self.incremental:
+                self._write_manifest(manifest)
 
-                audio.export(out_path, format=self.target_format)
\ No newline at end of file
+        if self.incremental:
+            removed = self._remove_orphans(manifest, seen)
+            if removed:
+                print(f"[CLEAN] {removed} orphaned outputs in {self.corpus}")
+            if not self.dry_run:
+                self._write_manifest(manifest)
@@ -0,0 +1,211 @@
+import os
+from pathlib import Path
+import numpy as np
+import torch
+from torch.ao.quantization import quantize_dynamic
+from transformers import AutoConfig, AutoModelForCTC
+from transformers.modeling_outputs import CausalLMOutput
+
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get("TRESTLE_CACHE", Path.home() / ".cache" / "trestle")
+) / "models"
+
+
+CTC_BACKENDS = {"eager", "onnx", "compile"}
+_ONNX_DTYPES = {
+    "tensor(float)": np.float32,
+    "tensor(int64)": np.int64,
+    "tensor(int32)": np.int32,
+}
+
+
+def cache_stem(model_name: str, revision: str | None = None) -> str:
+    """
+    File name stem of a cached model; hub checkpoints also carry the commit
+    they were downloaded at, so a new upload is not served stale weights
+    """
+    stem = model_name.strip("/").replace("/", "--")
+    if revision:
+        stem = f"{stem}@{revision[:12]}"
+    return stem
+
+
+def model_revision(model_name: str) -> str | None:
+    # None for local checkpoints
+    return getattr(AutoConfig.from_pretrained(model_name), "_commit_hash", None)
+
+
+def _tmp_path(path: Path) -> Path:
+    # per process, so concurrent exports to a cold cache do not clobber
+    # each other; the last os.replace wins with a complete file
+    return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+
+def quantize_ctc(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Dynamic int8 quantization of the linear layers (attention and
+    feed-forward); the conv feature encoder stays in float32
+    """
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_quantized_ctc(
+        model_name: str,
+        cache_dir: Path | None = None) -> torch.nn.Module:
+    """
+    int8 CTC model for CPU inference. The quantized weights are saved on the
+    first call; later calls build the model from its config and load them,
+    skipping the float32 checkpoint.
+    """
+    cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+    config = AutoConfig.from_pretrained(model_name)
+    stem = cache_stem(model_name, getattr(config, "_commit_hash", None))
+    path = cache_dir / f"{stem}-int8.pt"
+
+    if path.exists():
+        model = quantize_ctc(AutoModelForCTC.from_config(config)).eval()
+        model.load_state_dict(torch.load(path, weights_only=True))
+        return model
+
+    model = AutoModelForCTC.from_pretrained(
+        model_name,
+        dtype=torch.float32,
+        low_cpu_mem_usage=True,
+        attn_implementation="sdpa",
+    ).eval()
+    model = quantize_ctc(model)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = _tmp_path(path)
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+    return model
+
+
+class _LogitsOnly(torch.nn.Module):
+    """
+    Plain tensor in/out so the model traces to ONNX
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_values, attention_mask=None):
+        return self.model(
+            input_values=input_values, attention_mask=attention_mask
+        ).logits
+
+
+def export_ctc_onnx(
+        model_name: str,
+        with_attention_mask: bool,
+        cache_dir: Path | None = None) -> Path:
+    """
+    Export the float32 CTC model to ONNX with dynamic batch and time axes,
+    once per model name and revision
+    """
+    cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+    suffix = "-mask" if with_attention_mask else ""
+    stem = cache_stem(model_name, model_revision(model_name))
+    path = cache_dir / f"{stem}{suffix}.onnx"
+    if path.exists():
+        return path
+
+    model = AutoModelForCTC.from_pretrained(
+        model_name, dtype=torch.float32, attn_implementation="eager"
+    ).eval()
+    input_names = ["input_values"]
+    example = (torch.randn(2, 16_000),)
+    if with_attention_mask:
+        input_names.append("attention_mask")
+        example += (torch.ones(2, 16_000, dtype=torch.long),)
+    dynamic_axes = {name: {0: "batch", 1: "time"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch", 1: "frames"}
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = _tmp_path(path)
+    with torch.no_grad():
+        # the TorchScript exporter handles the conv feature encoder's
+        # length arithmetic, torch.export does not yet
+        torch.onnx.export(
+            _LogitsOnly(model),
+            example,
+            tmp_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            dynamo=False,
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+class OnnxCTCModel:
+    """
+    Exported CTC model run by onnxruntime on CPU, called like the
+    transformers model
+    """
+    def __init__(self, path: Path, config, num_threads: int | None = None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "backend='onnx' requires onnxruntime (pip install onnxruntime)"
+            ) from e
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            str(path), options, providers=["CPUExecutionProvider"]
+        )
+        # the feature extractor may hand out int32 masks
+        self.input_dtypes = {
+            i.name: _ONNX_DTYPES[i.type] for i in self.session.get_inputs()
+        }
+        self.config = config
+
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+    def __call__(self, **inputs) -> CausalLMOutput:
+        feeds = {
+            k: v.numpy().astype(self.input_dtypes[k], copy=False)
+            for k, v in inputs.items() if k in self.input_dtypes
+        }
+        logits = self.session.run(["logits"], feeds)[0]
+        return CausalLMOutput(logits=torch.from_numpy(logits))
+
+
+def compile_artifacts_path(model_name: str, cache_dir: Path | None = None) -> Path:
+    cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+    stem = cache_stem(model_name, model_revision(model_name))
+    return cache_dir / f"{stem}.compile.bin"
+
+
+def compile_ctc(
+        model: torch.nn.Module,
+        model_name: str,
+        cache_dir: Path | None = None) -> torch.nn.Module:
+    """
+    torch.compile with dynamic shapes, warm-started from the artifacts saved
+    by save_compile_artifacts on an earlier run
+    """
+    path = compile_artifacts_path(model_name, cache_dir)
+    if path.exists():
+        torch.compiler.load_cache_artifacts(path.read_bytes())
+    return torch.compile(model, dynamic=True)
+
+
+def save_compile_artifacts(model_name: str, cache_dir: Path | None = None):
+    artifacts = torch.compiler.save_cache_artifacts()
+    if artifacts is None:
+        return
+    path = compile_artifacts_path(model_name, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _tmp_path(path)
+    tmp_path.write_bytes(artifacts[0])
+    os.replace(tmp_path, path)
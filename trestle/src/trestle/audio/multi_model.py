@@ -0,0 +1,151 @@
+from dataclasses import dataclass
+from pathlib import Path
+import torch
+from tqdm import tqdm
+from trestle.io.profiling import StageTimer
+from trestle.audio.asr_pipeline import ASRPipelineBase
+
+
+@dataclass
+class _ModelRun:
+    pipeline: ASRPipelineBase
+    remaining: dict
+    groups: list
+    writers: dict
+    done: dict
+    out_paths: list[Path]
+
+
+class MultiCollator:
+    """
+    Run every pipeline's collator on one decoded batch, inside the
+    DataLoader workers. Each pipeline gets its own sample dicts (the cache
+    marks them) sharing the same waveform arrays, without the clips in its
+    skip set.
+    """
+    def __init__(self, collators):
+        self.collators = collators
+        self.skips: list[set[str]] = [set() for _ in collators]
+
+    def __call__(self, batch):
+        batch = [b for b in batch if b is not None]
+        collated = [
+            collator([dict(b) for b in batch if b["clip_path"] not in skip])
+            for collator, skip in zip(self.collators, self.skips)
+        ]
+        decode_s = sum(b.get("decode_s", 0.0) for b in batch)
+        return len(batch), decode_s, collated
+
+
+def _check_compatible(pipelines: list[ASRPipelineBase]):
+    lead = pipelines[0]
+    for pipeline in pipelines:
+        # one loader feeds every model, so the batch limits must agree too
+        for attr in (
+            "corpus", "root", "span", "batch_size", "max_samples_per_batch", "dry_run",
+        ):
+            if getattr(pipeline, attr) != getattr(lead, attr):
+                raise ValueError(f"pipelines differ in {attr}, run them separately")
+        if pipeline.shard is not None:
+            raise ValueError("run_multi_model does not take sharded pipelines")
+        if getattr(pipeline, "pack", False):
+            raise ValueError("pack=True reads its own windows, run that pipeline separately")
+    base_paths = [p.model_base for p in pipelines]
+    if len(set(base_paths)) != len(base_paths):
+        raise ValueError("two pipelines would write the same {model}_output file")
+
+
+@torch.no_grad()
+def run_multi_model(
+        pipelines: list[ASRPipelineBase],
+        dataset_cls,
+        limit: int | None = None) -> list[Path]:
+    """
+    Run several loaded pipelines (e.g. wav2vec2, HuBERT and Whisper) over
+    the clips of one corpus, reading and decoding every batch once and
+    handing it to each model in turn. The pipelines must share corpus,
+    root, span, batch_size, max_samples_per_batch and dry_run; DataLoader
+    workers and length bucketing follow the first pipeline. Each pipeline
+    extracts its own features in the workers and writes its own
+    {model}_output file. A clip is skipped only when every model already
+    has it. With dry_run every pipeline only reports its plan.
+
+    Returns the output paths of all pipelines
+    """
+    _check_compatible(pipelines)
+    lead = pipelines[0]
+    if lead.dry_run:
+        return [path for p in pipelines for path in p.run(dataset_cls, limit=limit)]
+
+    runs = []
+    for pipeline in pipelines:
+        pipeline._on_run_start()
+        pipeline._open_cache()
+        remaining, groups = pipeline._plan_groups(limit)
+        writers, done = pipeline._open_writers(remaining)
+        runs.append(_ModelRun(pipeline, remaining, groups, writers, done, list(remaining)))
+
+    collate_fn = MultiCollator([p._collator() for p in pipelines])
+    # the groups only differ in their output paths
+    for group_idx, lead_group in enumerate(runs[0].groups):
+        groups = [run.groups[group_idx] for run in runs]
+        skips = [
+            set.intersection(*(
+                run.pipeline._done_clips(group[unit][0], run.done)
+                for run, group in zip(runs, groups)
+            ))
+            for unit in range(len(lead_group))
+        ]
+        for run, group in zip(runs, groups):
+            run.pipeline._record_order(group, dataset_cls, limit)
+        dataset = lead._group_dataset(lead_group, dataset_cls, limit, skips)
+        # clips one model already has are not run through it again
+        collate_fn.skips = [
+            set().union(*(
+                run.pipeline._done_clips(out_path, run.done)
+                for out_path, _, _ in group
+            ))
+            for run, group in zip(runs, groups)
+        ]
+        loader = lead._make_loader(dataset, collate_fn=collate_fn)
+
+        loader_timer = StageTimer()
+        timers = [StageTimer() for _ in pipelines]
+        num_clips = 0
+        counts = [0] * len(pipelines)
+        hits = [0] * len(pipelines)
+
+        for batch_size, decode_s, collated in loader_timer.iter(
+            tqdm(
+                loader,
+                desc=f"{len(pipelines)} models on {lead.corpus}",
+                leave=False,
+            ),
+            "loader_wait",
+        ):
+            for i, (run, group, (inputs, samples, stats)) in enumerate(
+                zip(runs, groups, collated)
+            ):
+                if samples is None:
+                    continue
+                # decoding is shared, reported once for all models
+                stats.pop("decode", None)
+                hits[i] += run.pipeline._process_batch(
+                    group, inputs, samples, stats, run.writers, run.done, timers[i]
+                )
+                counts[i] += len(samples)
+            loader_timer.add("decode", decode_s)
+            num_clips += batch_size
+
+        print(f"[TIMING] {lead.corpus}: {loader_timer.summary(num_clips)}")
+        for i, (run, group) in enumerate(zip(runs, groups)):
+            run.pipeline._end_group(
+                group, run.remaining, run.writers, timers[i], counts[i], hits[i],
+                label=f"{run.pipeline.corpus}/{run.pipeline.model_base}",
+            )
+
+    out_paths = []
+    for run in runs:
+        run.pipeline._on_run_end()
+        out_paths.extend(run.pipeline._output_paths(run.out_paths))
+    return out_paths
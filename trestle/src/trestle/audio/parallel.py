@@ -0,0 +1,138 @@
+import os
+import queue
+import traceback
+import multiprocessing as mp
+from pathlib import Path
+import torch
+from trestle.audio.asr_pipeline import clear_shard_stats, merge_shard_stats, merge_shards
+
+
+def _run_shard(
+        results,
+        pipeline_cls,
+        dataset_cls,
+        rank: int,
+        num_procs: int,
+        device: str,
+        num_threads: int,
+        limit: int | None,
+        pipeline_kwargs: dict):
+    try:
+        torch.set_num_threads(num_threads)
+        pipeline = pipeline_cls(
+            **pipeline_kwargs, device=device, shard=(rank, num_procs)
+        )
+        results.put((rank, pipeline.run(dataset_cls, limit=limit), None))
+    except BaseException:
+        results.put((rank, None, traceback.format_exc()))
+        raise
+
+
+def _collect(procs, results) -> dict[int, list[Path]]:
+    """
+    Output paths per rank; raises as soon as one worker fails or dies
+    """
+    out: dict[int, list[Path]] = {}
+    while len(out) < len(procs):
+        try:
+            rank, paths, error = results.get(timeout=1.0)
+        except queue.Empty:
+            for rank, proc in enumerate(procs):
+                if rank not in out and proc.exitcode not in (None, 0):
+                    raise RuntimeError(
+                        f"worker {rank} exited with code {proc.exitcode}"
+                    )
+            continue
+        if error is not None:
+            raise RuntimeError(f"worker {rank} failed:\n{error}")
+        out[rank] = paths
+    return out
+
+
+def run_data_parallel(
+        pipeline_cls,
+        dataset_cls,
+        num_procs: int,
+        devices: list[str] | None = None,
+        threads_per_proc: int | None = None,
+        limit: int | None = None,
+        **pipeline_kwargs) -> list[Path]:
+    """
+    Run an ASR pipeline in num_procs worker processes, each with its own
+    model replica and a contiguous block of every metadata file, then merge
+    their outputs into the usual per-subset {model}_output files in
+    metadata order. The workers may run DataLoader workers of their own
+    (num_workers > 0); the fallback and assisted decoding stats they write
+    are summed into the usual files under meta_root.
+
+    Workers are spawned, so call it under if __name__ == "__main__" in
+    scripts.
+
+    pipeline_cls: CTCPipeline or Seq2SeqPipeline, built with pipeline_kwargs
+    devices: device per worker, cycled (e.g. ["cuda:0", "cuda:1"]);
+             defaults to pipeline_kwargs["device"] or cpu
+    threads_per_proc: intra-op threads per worker, defaults to the cores
+                      split evenly between workers
+    """
+    if devices is None:
+        devices = [pipeline_kwargs.pop("device", "cpu")]
+    else:
+        pipeline_kwargs.pop("device", None)
+    if threads_per_proc is None:
+        threads_per_proc = max(1, (os.cpu_count() or 1) // num_procs)
+
+    if pipeline_kwargs.get("dry_run"):
+        # the estimate covers every clip, one process is enough
+        return pipeline_cls(**pipeline_kwargs, device=devices[0]).run(
+            dataset_cls, limit=limit
+        )
+
+    meta_root = pipeline_kwargs.get("meta_root")
+    if meta_root is not None:
+        clear_shard_stats(meta_root, pipeline_kwargs["corpus"])
+
+    # spawn so CUDA and the loader workers start clean in every replica;
+    # plain processes rather than a Pool, whose daemonic workers cannot
+    # start DataLoader workers of their own
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(
+            target=_run_shard,
+            args=(
+                results,
+                pipeline_cls,
+                dataset_cls,
+                rank,
+                num_procs,
+                devices[rank % len(devices)],
+                threads_per_proc,
+                limit,
+                pipeline_kwargs,
+            ),
+        )
+        for rank in range(num_procs)
+    ]
+    for proc in procs:
+        proc.start()
+    try:
+        paths_by_rank = _collect(procs, results)
+    except BaseException:
+        for proc in procs:
+            proc.terminate()
+        raise
+    finally:
+        for proc in procs:
+            proc.join()
+
+    out_paths = sorted({p for paths in paths_by_rank.values() for p in paths})
+    for out_path in out_paths:
+        merge_shards(
+            out_path,
+            pipeline_kwargs.get("out_format", "parquet"),
+            num_shards=num_procs,
+            resume=pipeline_kwargs.get("resume", False),
+        )
+    if meta_root is not None:
+        merge_shard_stats(meta_root, pipeline_kwargs["corpus"], num_shards=num_procs)
+    return out_paths
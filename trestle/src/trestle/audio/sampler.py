@@ -0,0 +1,53 @@
+from typing import Iterator
+import numpy as np
+from torch.utils.data import Sampler
+
+
+class LengthBucketBatchSampler(Sampler[list[int]]):
+    """
+    Batch clips of similar length together to cut padding.
+    Indices are sorted by length; batches either hold batch_size clips or,
+    with max_samples_per_batch, as many clips as fit in that budget of
+    padded samples (clips x longest clip).
+    """
+    def __init__(
+            self,
+            lengths: list[int] | np.ndarray,
+            batch_size: int | None = None,
+            max_samples_per_batch: int | None = None):
+        if batch_size is None and max_samples_per_batch is None:
+            raise ValueError("batch_size or max_samples_per_batch is required")
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.max_samples_per_batch = max_samples_per_batch
+        self.batches = self._build()
+
+    def _build(self) -> list[list[int]]:
+        order = np.argsort(self.lengths, kind="stable")
+        batches = []
+        batch: list[int] = []
+
+        for idx in order.tolist():
+            longest = self.lengths[idx]
+            full = (
+                self.batch_size is not None
+                and len(batch) >= self.batch_size
+            ) or (
+                self.max_samples_per_batch is not None
+                and batch
+                and (len(batch) + 1) * longest > self.max_samples_per_batch
+            )
+            if full:
+                batches.append(batch)
+                batch = []
+            batch.append(idx)
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def __iter__(self) -> Iterator[list[int]]:
+        return iter(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+import numpy as np
+
+VAD_COLUMNS = ["vad_starts", "vad_ends", "vad_num_frames"]
+
+
+@dataclass
+class VADConfig:
+    """
+    Energy-based voice activity detection on fixed frames.
+
+    threshold_db: frames quieter than the loudest frame of the clip by more
+                  than this are silence
+    floor_db: frames below this absolute level (dBFS) are always silence
+    min_speech_ms: louder bursts shorter than this (clicks) are ignored
+    pad_ms: silence kept around each speech region
+    split_pause_ms: internal pauses longer than this are cut down to
+                    2 * pad_ms; None only trims the clip ends
+    """
+    frame_ms: float = 20.0
+    threshold_db: float = 35.0
+    floor_db: float = -60.0
+    min_speech_ms: float = 60.0
+    pad_ms: float = 150.0
+    split_pause_ms: float | None = None
+
+
+def speech_segments(
+        waveform: np.ndarray,
+        sampling_rate: int,
+        config: VADConfig) -> np.ndarray:
+    """
+    (start, end) sample offsets of the parts of the clip to keep, in order.
+    A clip without speech is kept whole.
+    """
+    num_samples = len(waveform)
+    hop = max(int(sampling_rate * config.frame_ms / 1000), 1)
+    num_frames = num_samples // hop
+    whole = np.array([[0, num_samples]], dtype=np.int64)
+    if num_frames == 0:
+        return whole
+
+    frames = np.asarray(
+        waveform[:num_frames * hop], dtype=np.float32
+    ).reshape(num_frames, hop)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    threshold = max(energy_db.max() - config.threshold_db, config.floor_db)
+    speech = np.concatenate([[0], (energy_db > threshold).astype(np.int8), [0]])
+
+    # runs of speech frames as [start, end)
+    edges = np.diff(speech)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = ends - starts >= config.min_speech_ms / config.frame_ms
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return whole
+
+    # join regions unless the pause between them is long enough to cut;
+    # pauses shorter than the padding on both sides are never cut
+    pad = int(round(config.pad_ms / config.frame_ms))
+    if config.split_pause_ms is None:
+        starts, ends = starts[:1], ends[-1:]
+    else:
+        min_pause = max(config.split_pause_ms / config.frame_ms, 2 * pad)
+        cut = starts[1:] - ends[:-1] > min_pause
+        starts = np.concatenate([starts[:1], starts[1:][cut]])
+        ends = np.concatenate([ends[:-1][cut], ends[-1:]])
+    starts = np.maximum(starts - pad, 0)
+    ends = np.minimum(ends + pad, num_frames)
+
+    segments = np.stack([starts, ends], axis=1).astype(np.int64) * hop
+    # the last partial frame belongs to a region reaching the end
+    segments[segments[:, 1] == num_frames * hop, 1] = num_samples
+    return segments
+
+
+def apply_segments(waveform: np.ndarray, starts, ends) -> np.ndarray:
+    if len(starts) == 1:
+        return waveform[starts[0]:ends[0]]
+    return np.concatenate([waveform[s:e] for s, e in zip(starts, ends)])
+
+
+def format_vad_report(label: str, stats: dict) -> str:
+    removed = stats["audio_s"] - stats["kept_s"]
+    share = removed / stats["audio_s"] if stats["audio_s"] else 0.0
+    # compute scales with audio length for CTC models; whisper pads every
+    # window to 30 s, so it only gains together with pack=True
+    speedup = stats["audio_s"] / stats["kept_s"] if stats["kept_s"] else 1.0
+    return (
+        f"[VAD] {label}: clips={stats['clips']} audio_s={stats['audio_s']:.1f} "
+        f"removed_s={removed:.1f} ({share:.1%}) untrimmed={stats['untrimmed']} "
+        f"est_speedup={speedup:.2f}x"
+    )
@@ -1,8 +1,12 @@
 from .config import load_config
 from .text_wrapper import ChaTextWrapper, TaskBoundary
 from .batch_wrapper import BatchWrapperBase
-from .audio_utils import clip_audio_batch
+from .audio_utils import clip_audio_batch, convert_audio_file
+from .table_writer import ChunkedTableWriter, write_table, read_table
+from .result_cache import ResultCache, EncoderCache
 
-__all__ = ["load_config", 'clip_audio_batch',
+__all__ = ["load_config", 'clip_audio_batch', 'convert_audio_file',
            'ChaTextWrapper', 'TaskBoundary',
-           'BatchWrapperBase']
\ No newline at end of file
+           'BatchWrapperBase',
+           'ChunkedTableWriter', 'write_table', 'read_table',
+           'ResultCache', 'EncoderCache']
\ No newline at end of file
@@ -1,55 +1,489 @@
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+import hashlib
+import mmap
+import shutil
+import struct
+import subprocess
+import tempfile
+import wave
+import numpy as np
+import polars as pl
+import torch
 import torchaudio
 
 
-def clip_audio_batch(job):
+@dataclass
+class ConvertJob:
+    src: Path
+    out_path: Path
+    target_sr: int
+    target_format: str
+    backend: str = "pydub"
+    chunk_seconds: float = 30.0
+
+
+def hash_file(path, chunk_size: int = 1 << 20) -> str:
+    """
+    Content hash of a file, read in fixed-size chunks
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _convert_pydub(job: ConvertJob):
+    # pydub depends on audioop, which is gone from python 3.13+
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(job.src)
+
+    # convert to mono
+    if audio.channels > 1:
+        audio = audio.set_channels(1)
+
+    if Path(job.src).suffix.lower() == ".mp3":
+        audio = audio.set_sample_width(2)
+
+    # resample
+    if audio.frame_rate != job.target_sr:
+        audio = audio.set_frame_rate(job.target_sr)
+
+    audio.export(job.out_path, format=job.target_format)
+
+
+@lru_cache(maxsize=None)
+def get_resampler(orig_sr: int, new_sr: int) -> torchaudio.transforms.Resample:
+    """
+    Polyphase resampler for one (orig_sr, new_sr) pair.
+    The sinc filter bank is built once and reused for every file.
+    """
+    return torchaudio.transforms.Resample(orig_freq=orig_sr, new_freq=new_sr)
+
+
+def _convert_torchaudio(job: ConvertJob):
+    waveform, sr = torchaudio.load(job.src)
+
+    # convert to mono
+    if waveform.size(0) > 1:
+        waveform = waveform.mean(dim=0, keepdim=True)
+
+    # resample
+    if sr != job.target_sr:
+        waveform = get_resampler(sr, job.target_sr)(waveform)
+
+    # 16-bit PCM, same as the pydub path for mp3 sources
+    save_kwargs = {}
+    if job.target_format == "wav":
+        save_kwargs = dict(encoding="PCM_S", bits_per_sample=16)
+
+    torchaudio.save(
+        job.out_path,
+        waveform.clamp(-1.0, 1.0),
+        job.target_sr,
+        format=job.target_format,
+        **save_kwargs,
+    )
+
+
+def _convert_stream(job: ConvertJob):
+    """
+    Decode, downmix and resample with an ffmpeg subprocess, appending its
+    raw output to the .wav in fixed-size chunks. The ffmpeg resampler keeps
+    its filter state across chunks, so memory stays bounded by chunk_seconds
+    for any file length.
+    """
+    if job.target_format != "wav":
+        raise ValueError("stream backend only writes .wav files")
+    # torchaudio.io.StreamReader is deprecated, the ffmpeg CLI is not
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("stream backend needs the ffmpeg binary on PATH")
+
+    cmd = [
+        "ffmpeg", "-nostdin", "-v", "error", "-i", str(job.src),
+        "-ac", "1", "-ar", str(job.target_sr), "-f", "s16le", "-",
+    ]
+    # 16-bit mono
+    chunk_bytes = int(job.chunk_seconds * job.target_sr) * 2
+
+    # stderr goes to a file: a pipe nobody reads while stdout is drained
+    # fills up on damaged input and blocks ffmpeg
+    with tempfile.TemporaryFile() as log:
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log) as proc:
+            with wave.open(str(job.out_path), "wb") as out:
+                out.setnchannels(1)
+                out.setsampwidth(2)
+                out.setframerate(job.target_sr)
+
+                while chunk := proc.stdout.read(chunk_bytes):
+                    out.writeframes(chunk)
+        log.seek(0)
+        error = log.read().decode(errors="replace").strip()
+
+    if proc.returncode != 0:
+        Path(job.out_path).unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg exited with {proc.returncode}: {error}")
+
+
+RESAMPLE_BACKENDS = {
+    "pydub": _convert_pydub,
+    "torchaudio": _convert_torchaudio,
+    "stream": _convert_stream,
+}
+
+
+def convert_audio_file(job: ConvertJob):
+    """
+    Convert ONE audio file to a mono file at the target sample rate.
+    Returns (src, error), where error is None on success.
+    """
+    try:
+        RESAMPLE_BACKENDS[job.backend](job)
+    except Exception as e:
+        return job.src, f"{type(e).__name__}: {e}"
+
+    return job.src, None
+
+
+# (format tag, bits per sample) -> sample dtype
+_WAV_DTYPES = {
+    (1, 16): np.int16,
+    (3, 32): np.float32,
+}
+
+
+@dataclass
+class WavHeader:
+    tag: int
+    channels: int
+    sample_rate: int
+    bits: int
+    offset: int
+    num_frames: int
+
+
+def read_wav_header(path) -> WavHeader | None:
+    """
+    Parse the fmt and data chunks of a wav file without reading samples.
+    Returns None when path is not a RIFF/WAVE file.
+    """
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            return None
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, size = struct.unpack("<4sI", header)
+
+            if chunk_id == b"fmt ":
+                data = f.read(size + (size & 1))
+                tag, channels, sr, _, _, bits = struct.unpack(
+                    "<HHIIHH", data[:16]
+                )
+                # WAVE_FORMAT_EXTENSIBLE stores the real tag in the subformat
+                if tag == 0xFFFE and size >= 26:
+                    tag = struct.unpack("<H", data[24:26])[0]
+                fmt = (tag, channels, sr, bits)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + (size & 1), 1)
+
+        file_size = f.seek(0, 2)
+
+    if fmt is None:
+        return None
+
+    tag, channels, sr, bits = fmt
+    frame_bytes = channels * bits // 8
+    if frame_bytes == 0:
+        return None
+
+    # streamed writers may leave the data size unset
+    size = min(size, file_size - offset)
+    return WavHeader(
+        tag=tag,
+        channels=channels,
+        sample_rate=sr,
+        bits=bits,
+        offset=offset,
+        num_frames=size // frame_bytes,
+    )
+
+
+def open_wav_memmap(path, sequential: bool = False) -> tuple[np.ndarray, int] | None:
+    """
+    Memory-map the samples of a PCM wav file as a (frames, channels) array.
+    Returns None when the file is not a 16-bit int or 32-bit float wav.
+    sequential tells the kernel the file will be read front to back, so it
+    reads ahead more aggressively.
+    """
+    header = read_wav_header(path)
+    if header is None or header.num_frames == 0:
+        return None
+
+    dtype = _WAV_DTYPES.get((header.tag, header.bits))
+    if dtype is None:
+        return None
+
+    shape = (header.num_frames, header.channels)
+    if not sequential:
+        samples = np.memmap(path, dtype=dtype, mode="r", offset=header.offset, shape=shape)
+        return samples, header.sample_rate
+
+    with open(path, "rb") as f:
+        raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, "MADV_SEQUENTIAL"):
+        raw.madvise(mmap.MADV_SEQUENTIAL)
+    # the array keeps the mapping alive
+    samples = np.frombuffer(
+        raw, dtype=dtype, count=shape[0] * shape[1], offset=header.offset
+    ).reshape(shape)
+    return samples, header.sample_rate
+
+
+def wav_frames_to_tensor(frames: np.ndarray) -> torch.Tensor:
+    """
+    (frames, channels) wav samples -> (channels, frames) float32 tensor,
+    normalized the same way as torchaudio.load. Always copies, so float32
+    frames from a read-only memmap give a writable tensor.
+    """
+    waveform = np.array(frames, dtype=np.float32, copy=True)
+    if frames.dtype == np.int16:
+        waveform /= 32768.0
+    return torch.from_numpy(np.ascontiguousarray(waveform.T))
+
+
+def _open_source(src, decode_once: bool):
+    """
+    Returns (sr, total_frames, read), where read(start, num_frames) gives a
+    (channels, frames) float32 tensor.
+    decode_once memory-maps PCM wav sources, or decodes others in one pass,
+    instead of seeking into the file once per clip.
+    """
+    if not decode_once:
+        info = torchaudio.info(src)
+
+        def read(start, num_frames):
+            waveform, _ = torchaudio.load(
+                src,
+                frame_offset=start,
+                num_frames=num_frames,
+            )
+            return waveform
+
+        return info.sample_rate, info.num_frames, read
+
+    mapped = open_wav_memmap(src)
+    if mapped is not None:
+        samples, sr = mapped
+
+        def read(start, num_frames):
+            return wav_frames_to_tensor(samples[start:start + num_frames])
+
+        return sr, samples.shape[0], read
+
+    decoded, sr = torchaudio.load(src)
+
+    def read(start, num_frames):
+        return decoded[:, start:start + num_frames]
+
+    return sr, decoded.size(1), read
+
+
+def _source_info(src) -> tuple[int, int]:
+    """
+    (sample rate, total frames) of src without decoding it
+    """
+    header = read_wav_header(src)
+    if header is not None and header.num_frames > 0:
+        return header.sample_rate, header.num_frames
+    info = torchaudio.info(src)
+    return info.sample_rate, info.num_frames
+
+
+class ClipShardWriter:
+    """
+    Append int16 mono clips to large shard .wav files under out_dir.
+    A new shard is started once max_bytes is reached or the sample rate
+    changes, so each shard stays a plain wav that can be memory-mapped.
+    """
+    def __init__(self, out_dir: Path, max_bytes: int):
+        self.out_dir = Path(out_dir)
+        self.max_bytes = max_bytes
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        # shards from a previous run would no longer match the metadata
+        for stale in self.out_dir.glob("shard-*.wav"):
+            stale.unlink()
+        self._writer = None
+        self._path = None
+        self._sr = None
+        self._frames = 0
+        self._count = 0
+
+    def _roll(self, sr: int):
+        self.close()
+        self._path = self.out_dir / f"shard-{self._count:05d}.wav"
+        self._count += 1
+        self._writer = wave.open(str(self._path), "wb")
+        self._writer.setnchannels(1)
+        self._writer.setsampwidth(2)
+        self._writer.setframerate(sr)
+        self._sr = sr
+        self._frames = 0
+
+    def write(self, samples: np.ndarray, sr: int) -> tuple[str, int, int]:
+        """
+        Returns (shard path, start_frame, end_frame) of the written clip
+        """
+        if (
+            self._writer is None
+            or sr != self._sr
+            or (self._frames + len(samples)) * 2 > self.max_bytes
+        ):
+            self._roll(sr)
+
+        start = self._frames
+        self._writer.writeframes(samples.astype("<i2").tobytes())
+        self._frames += len(samples)
+        return str(self._path), start, self._frames
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def to_int16_mono(waveform: torch.Tensor) -> np.ndarray:
+    """
+    (channels, frames) float tensor -> (frames,) int16 array
+    """
+    if waveform.size(0) > 1:
+        waveform = waveform.mean(dim=0, keepdim=True)
+    samples = (waveform[0] * 32768.0).round().clamp(-32768, 32767)
+    return samples.to(torch.int16).numpy()
+
+
+def _clip_is_complete(clip_path, num_frames: int) -> bool:
+    try:
+        header = read_wav_header(clip_path)
+    except (OSError, struct.error):
+        return False
+    return header is not None and header.num_frames == num_frames
+
+
+@dataclass
+class ClipJob:
+    """
+    All clips cut from ONE source recording.
+    clips holds the pid, text, start, end (ms) and clip_path columns.
+    """
+    src: Path
+    clips: pl.DataFrame
+
+
+def clip_audio_batch(
+        job: ClipJob,
+        decode_once: bool = False,
+        store: str = "wav",
+        skip_existing: bool = False):
     """
     Process all clips for ONE audio file.
     start/end are in milliseconds.
+    decode_once: open the source once and slice every clip from it
+    store: "wav" writes one file per clip, "virtual" only records the frame
+           range of each clip in the source recording, "shard" returns the
+           int16 samples under "audio" for the caller to pack into shards
+    skip_existing: keep .wav clips already on disk with the expected number
+                   of frames instead of cutting them again
     """
-    src, clips = job
+    src = job.src
     records = []
+    virtual = store == "virtual"
+    # virtual clips and clips already on disk only need the sample rate,
+    # the source is opened once the first missing clip is cut
+    probe_first = virtual or (skip_existing and store == "wav")
 
     try:
-        info = torchaudio.info(src)
-        sr = info.sample_rate
-        total_frames = info.num_frames
-    except RuntimeError:
+        if probe_first:
+            sr, total_frames = _source_info(src)
+            read = None
+        else:
+            sr, total_frames, read = _open_source(src, decode_once)
+    except (RuntimeError, OSError, struct.error):
         return records
 
-    for clip in clips:
-        start_ms = clip["start"]
-        end_ms = clip["end"]
+    starts = job.clips["start"].to_numpy()
+    ends = job.clips["end"].to_numpy()
+    start_frames = (starts * sr / 1000).astype(np.int64)
+    num_frames = ((ends - starts) * sr / 1000).astype(np.int64)
+    valid = (
+        (num_frames > 0)
+        & (start_frames >= 0)
+        & (start_frames + num_frames <= total_frames)
+    )
+
+    pids = job.clips["pid"].to_list()
+    texts = job.clips["text"].to_list()
+    clip_paths = job.clips["clip_path"].to_list()
+
+    for i in np.flatnonzero(valid):
+        start_frame = int(start_frames[i])
+        n = int(num_frames[i])
+        clip_path = clip_paths[i]
 
-        start_frame = int(start_ms * sr / 1000)
-        num_frames = int((end_ms - start_ms) * sr / 1000)
+        record = {
+            "clip_path": clip_path,
+            "pid": pids[i],
+            "text": texts[i],
+            "source_audio": str(src),
+            "num_frames": n,
+            "sample_rate": sr,
+            "duration_ms": n * 1000 / sr,
+        }
 
         if (
-            num_frames <= 0
-            or start_frame < 0
-            or start_frame + num_frames > total_frames
+            skip_existing
+            and store == "wav"
+            and _clip_is_complete(clip_path, n)
         ):
+            records.append(record)
             continue
 
-        try:
-            waveform, _ = torchaudio.load(
-                src,
-                frame_offset=start_frame,
-                num_frames=num_frames,
+        if virtual:
+            record.update(
+                start_frame=start_frame,
+                end_frame=start_frame + n,
             )
+            records.append(record)
+            continue
+
+        if read is None:
+            try:
+                _, _, read = _open_source(src, decode_once)
+            except (RuntimeError, OSError, struct.error):
+                return records
+
+        try:
+            waveform = read(start_frame, n)
         except RuntimeError:
             continue
 
         if waveform.numel() == 0:
             continue
 
-        torchaudio.save(clip["clip_path"], waveform, sr)
-
-        records.append({
-            "clip_path": str(clip["clip_path"]),
-            "pid": clip["pid"],
-            "text": clip["text"],
-            "source_audio": str(src),
-        })
+        if store == "shard":
+            record.update(audio=to_int16_mono(waveform))
+        else:
+            torchaudio.save(clip_path, waveform, sr)
+        records.append(record)
 
-    return records
\ No newline at end of file
+    return records
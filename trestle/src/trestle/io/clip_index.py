@@ -0,0 +1,97 @@
+from dataclasses import dataclass
+from pathlib import Path
+import polars as pl
+
+# rough processing seconds per audio second, used when no measured value is
+# passed; calibrate with a short run on the target machine
+DEFAULT_RTF = {
+    "clip": 0.005,
+    "ctc": 0.02,
+    "seq2seq": 0.1,
+}
+
+
+def clip_durations_ms(df: pl.DataFrame) -> pl.Series | None:
+    """
+    Clip durations from the metadata index, None for metadata written
+    before the index existed
+    """
+    if "duration_ms" in df.columns:
+        return df["duration_ms"].cast(pl.Float64)
+    if {"start_frame", "end_frame", "sample_rate"} <= set(df.columns):
+        return df.select(
+            (pl.col("end_frame") - pl.col("start_frame"))
+            * 1000 / pl.col("sample_rate")
+        ).to_series()
+    return None
+
+
+@dataclass
+class CostEstimate:
+    clips: int
+    audio_seconds: float | None
+    disk_bytes: int | None
+    runtime_seconds: float | None
+
+    @classmethod
+    def from_durations(
+            cls,
+            clips: int,
+            durations_ms: pl.Series | None,
+            bytes_per_second: float,
+            rtf: float,
+            fixed_bytes: int = 0):
+        if durations_ms is None:
+            return cls(clips, None, None, None)
+        seconds = float(durations_ms.sum()) / 1000
+        return cls(
+            clips=clips,
+            audio_seconds=seconds,
+            disk_bytes=int(seconds * bytes_per_second) + fixed_bytes,
+            runtime_seconds=seconds * rtf,
+        )
+
+    def __str__(self):
+        if self.audio_seconds is None:
+            return (
+                f"clips={self.clips}\n"
+                "audio_hours=unknown (metadata has no duration index)\n"
+            )
+        return (
+            f"clips={self.clips}\n"
+            f"audio_hours={self.audio_seconds / 3600:.2f}\n"
+            f"projected_disk_mb={self.disk_bytes / 1024 ** 2:.1f}\n"
+            f"estimated_runtime_min={self.runtime_seconds / 60:.1f}\n"
+        )
+
+
+def estimate_from_metadata(
+        meta_files: list[Path],
+        bytes_per_second: float,
+        rtf: float,
+        bytes_per_clip: int = 0,
+        limit: int | None = None) -> CostEstimate:
+    """
+    Cost of processing the clips listed in metadata files, read from the
+    index only so no audio is opened
+    """
+    clips = 0
+    durations = []
+    known = True
+    for meta_path in meta_files:
+        df = pl.read_parquet(meta_path)
+        if limit is not None:
+            df = df.head(limit)
+        clips += df.height
+        dur = clip_durations_ms(df)
+        if dur is None:
+            known = False
+        else:
+            durations.append(dur)
+
+    series = pl.concat(durations) if known and durations else None
+    if known and not durations:
+        series = pl.Series([], dtype=pl.Float64)
+    return CostEstimate.from_durations(
+        clips, series, bytes_per_second, rtf, fixed_bytes=bytes_per_clip * clips
+    )
@@ -0,0 +1,43 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Accumulate wall time per pipeline stage
+    """
+    def __init__(self):
+        self.totals: dict[str, float] = defaultdict(float)
+
+    def add(self, stage: str, seconds: float):
+        self.totals[stage] += seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+
+    def iter(self, iterable, name: str):
+        """
+        Time spent waiting on each next() of iterable
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.totals[name] += time.perf_counter() - start
+            yield item
+
+    def summary(self, clips: int | None = None) -> str:
+        parts = [f"{k}={v:.2f}s" for k, v in self.totals.items()]
+        if clips:
+            parts.append(f"clips={clips}")
+        return " ".join(parts)
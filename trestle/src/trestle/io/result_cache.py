@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+import numpy as np
+
+
+def audio_hash(waveform: np.ndarray, sampling_rate: int, namespace: str = "") -> str:
+    h = hashlib.blake2b(digest_size=20)
+    h.update(namespace.encode())
+    h.update(str(sampling_rate).encode())
+    h.update(np.ascontiguousarray(waveform).tobytes())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Predictions kept on disk in sqlite, keyed by a namespace (model, revision,
+    dtype, generation config) and a hash of the clip audio. Least recently
+    used entries are evicted once the stored predictions exceed max_mb.
+    Lookups are safe from DataLoader workers, spawned or forked: a worker
+    never reuses the connection of its parent. Writes happen in the main
+    process.
+    """
+    def __init__(self, path: Path, namespace: dict, max_mb: float = 1024):
+        self.path = Path(path)
+        self.namespace = json.dumps(namespace, sort_keys=True, default=str)
+        self.max_bytes = int(max_mb * 1024 ** 2)
+        self._conn: sqlite3.Connection | None = None
+        # process that opened _conn
+        self._pid: int | None = None
+        self._total_bytes: int | None = None
+
+    def __getstate__(self):
+        # each worker opens its own connection
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        return state
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            # a forked worker inherits the parent's connection, which sqlite
+            # does not allow to be used across processes; leave it unclosed
+            self._conn = None
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, prediction TEXT, "
+                "size INTEGER, last_used REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used "
+                "ON results (last_used)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def key(self, waveform: np.ndarray, sampling_rate: int) -> str:
+        return audio_hash(waveform, sampling_rate, self.namespace)
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connect().execute(
+            f"SELECT key, prediction FROM results WHERE key IN ({placeholders})",
+            keys,
+        )
+        return dict(rows.fetchall())
+
+    def touch(self, keys: list[str]):
+        """
+        Mark entries as used so eviction keeps them
+        """
+        if not keys:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.executemany(
+            "UPDATE results SET last_used = ? WHERE key = ?",
+            [(now, key) for key in keys],
+        )
+        conn.commit()
+
+    def put_many(self, items: dict[str, str]):
+        if not items:
+            return
+        conn = self._connect()
+        if self._total_bytes is None:
+            self._total_bytes = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()[0]
+
+        now = time.time()
+        rows = [
+            (key, pred, len(key) + len(pred.encode()), now)
+            for key, pred in items.items()
+        ]
+        replaced = self.get_many(list(items))
+        conn.executemany(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows
+        )
+        self._total_bytes += sum(row[2] for row in rows)
+        self._total_bytes -= sum(
+            len(key) + len(pred.encode()) for key, pred in replaced.items()
+        )
+        conn.commit()
+
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        conn = self._connect()
+        excess = self._total_bytes - self.max_bytes
+        stale = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM results ORDER BY last_used"
+        ):
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+        conn.executemany("DELETE FROM results WHERE key = ?", stale)
+        conn.commit()
+        self._total_bytes = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class EncoderCache:
+    """
+    Encoder hidden states per clip as .npy files in the model dtype
+    (bfloat16 as float32), keyed by a model namespace and the clip's
+    audio_hash, so decoding sweeps and reruns skip the encoder. Nothing is
+    evicted: a whisper-large clip takes ~4 MB in float16, ~8 MB in float32.
+    """
+    def __init__(self, root: Path, namespace: dict):
+        self.root = Path(root)
+        self.namespace = json.dumps(namespace, sort_keys=True, default=str)
+
+    def _path(self, clip_hash: str) -> Path:
+        key = hashlib.blake2b(
+            (self.namespace + clip_hash).encode(), digest_size=20
+        ).hexdigest()
+        return self.root / key[:2] / f"{key}.npy"
+
+    def get(self, clip_hash: str) -> np.ndarray | None:
+        path = self._path(clip_hash)
+        if not path.exists():
+            return None
+        return np.load(path)
+
+    def put(self, clip_hash: str, hidden: np.ndarray):
+        path = self._path(clip_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # per process, so data-parallel workers writing the same clip do
+        # not clobber each other's temp file; the last os.replace wins
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, hidden)
+        os.replace(tmp_path, path)
@@ -0,0 +1,99 @@
+import os
+import shutil
+from pathlib import Path
+import polars as pl
+
+
+def write_table(df: pl.DataFrame, path: Path, format: str):
+    """
+    Write df to path atomically in one of the supported formats
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    if format == "parquet":
+        df.write_parquet(tmp_path)
+    elif format == "jsonl":
+        df.write_ndjson(tmp_path)
+    elif format == "csv":
+        df.write_csv(tmp_path)
+    else:
+        raise ValueError(f"Unsupported format: {format}")
+    os.replace(tmp_path, path)
+
+
+def read_table(path: Path, format: str) -> pl.DataFrame:
+    if format == "parquet":
+        return pl.read_parquet(path)
+    elif format == "jsonl":
+        return pl.read_ndjson(path)
+    elif format == "csv":
+        return pl.read_csv(path)
+    raise ValueError(f"Unsupported format: {format}")
+
+
+class ChunkedTableWriter:
+    """
+    Write rows to out_path in chunks.
+    Every flush_every rows a parquet part is written (temp file + rename) to
+    a {name}.parts folder next to out_path, so a crash only loses the rows of
+    the current chunk. finalize() merges the parts into out_path atomically.
+    """
+    def __init__(
+            self,
+            out_path: Path,
+            format: str = "parquet",
+            flush_every: int = 1000):
+        self.out_path = Path(out_path)
+        self.format = format
+        self.flush_every = flush_every
+        self.parts_dir = self.out_path.with_name(f"{self.out_path.name}.parts")
+        self._rows: list[dict] = []
+        self._num_parts = len(self._part_files())
+
+    def _part_files(self) -> list[Path]:
+        if not self.parts_dir.exists():
+            return []
+        return sorted(self.parts_dir.glob("part-*.parquet"))
+
+    def read_parts(self) -> pl.DataFrame | None:
+        """
+        Rows flushed by this or a previous (interrupted) writer
+        """
+        parts = [pl.read_parquet(p) for p in self._part_files()]
+        if not parts:
+            return None
+        return pl.concat(parts, how="diagonal_relaxed")
+
+    def clear(self):
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        self._rows = []
+        self._num_parts = 0
+
+    def write(self, rows: list[dict]):
+        self._rows.extend(rows)
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+        part_path = self.parts_dir / f"part-{self._num_parts:05d}.parquet"
+        write_table(
+            pl.DataFrame(self._rows, infer_schema_length=None),
+            part_path,
+            "parquet",
+        )
+        self._num_parts += 1
+        self._rows = []
+
+    def finalize(self) -> pl.DataFrame | None:
+        """
+        Merge all parts into out_path and remove them
+        """
+        self.flush()
+        df = self.read_parts()
+        if df is not None:
+            write_table(df, self.out_path, self.format)
+        self.clear()
+        return df
@@ -0,0 +1,72 @@
+import json
+import wave
+import numpy as np
+import polars as pl
+import pytest
+import torch
+from transformers import (
+    Wav2Vec2Config,
+    Wav2Vec2CTCTokenizer,
+    Wav2Vec2FeatureExtractor,
+    Wav2Vec2ForCTC,
+    Wav2Vec2Processor,
+)
+
+
+@pytest.fixture(scope="session")
+def tiny_ctc(tmp_path_factory):
+    """
+    Randomly initialised wav2vec2 with a character vocabulary; no attention
+    mask, like wav2vec2-base
+    """
+    path = tmp_path_factory.mktemp("tiny_ctc")
+    torch.manual_seed(0)
+    chars = ["<pad>", "<s>", "</s>", "<unk>", "|"] + [chr(c) for c in range(ord("A"), ord("Z") + 1)]
+    (path / "vocab.json").write_text(json.dumps({c: i for i, c in enumerate(chars)}))
+    tokenizer = Wav2Vec2CTCTokenizer(str(path / "vocab.json"))
+    Wav2Vec2Processor(
+        feature_extractor=Wav2Vec2FeatureExtractor(return_attention_mask=False),
+        tokenizer=tokenizer,
+    ).save_pretrained(path)
+    Wav2Vec2ForCTC(Wav2Vec2Config(
+        vocab_size=len(chars), hidden_size=32, num_hidden_layers=2,
+        num_attention_heads=2, intermediate_size=37,
+        conv_dim=(32, 32, 32), conv_kernel=(10, 4, 4), conv_stride=(5, 4, 4),
+        num_conv_pos_embeddings=16, num_conv_pos_embedding_groups=2,
+        feat_extract_norm="group", pad_token_id=0,
+    )).save_pretrained(path)
+    return path
+
+
+def write_virtual_clips(root, corpus: str, lengths: dict[str, list[int]], seed: int = 0):
+    """
+    One noise recording per subset with back-to-back virtual clips of the
+    given lengths (frames at 16 kHz); returns the metadata paths
+    """
+    rng = np.random.default_rng(seed)
+    meta_paths = []
+    for subset, clip_lengths in lengths.items():
+        meta_dir = root / corpus / subset
+        meta_dir.mkdir(parents=True)
+        source = meta_dir / "rec.wav"
+        samples = (rng.standard_normal(sum(clip_lengths)) * 3000).astype(np.int16)
+        with wave.open(str(source), "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(16000)
+            out.writeframes(samples.tobytes())
+        ends = np.cumsum(clip_lengths)
+        pl.DataFrame({
+            "clip_path": [f"clip{i:02d}.wav" for i in range(len(clip_lengths))],
+            "source_audio": [str(source)] * len(clip_lengths),
+            "start_frame": ends - np.asarray(clip_lengths),
+            "end_frame": ends,
+            "sample_rate": [16000] * len(clip_lengths),
+        }).write_parquet(meta_dir / "metadata.parquet")
+        meta_paths.append(meta_dir / "metadata.parquet")
+    return meta_paths
+
+
+@pytest.fixture
+def virtual_clips():
+    return write_virtual_clips
@@ -0,0 +1,27 @@
+import polars as pl
+from trestle.audio import AudioClipper
+
+
+def test_clip_names(tmp_path):
+    source = tmp_path / "rec.wav"
+    source.write_bytes(b"")
+    text_dir = tmp_path / "text" / "corp" / "s1"
+    text_dir.mkdir(parents=True)
+    pl.DataFrame({
+        "start": [0, 500],
+        "end": [400, 900],
+        "text": ["a", "b"],
+        "pid": ["CHI", None],
+        "audio_path": [str(source)] * 2,
+    }).write_parquet(text_dir / "task_utterance.parquet")
+    clipper = AudioClipper("corp", tmp_path / "text", tmp_path / "out")
+    out_dir = tmp_path / "out" / "corp" / "s1"
+
+    jobs = clipper._plan_jobs(next(iter(clipper.iter_batches())), out_dir)
+
+    assert len(jobs) == 1
+    # a missing pid is written as None, as in clip trees of earlier runs
+    assert jobs[0].clips["clip_path"].to_list() == [
+        f"{out_dir}/task_CHI_0_400.wav",
+        f"{out_dir}/task_None_500_900.wav",
+    ]
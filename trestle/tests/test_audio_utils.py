@@ -0,0 +1,187 @@
+import os
+import struct
+import threading
+import wave
+import numpy as np
+from trestle.io.audio_utils import (
+    ConvertJob, convert_audio_file, open_wav_memmap, read_wav_header,
+    wav_frames_to_tensor,
+)
+
+
+def write_wav(path, samples: np.ndarray, sr: int = 16000):
+    """int16 (frames, channels) samples through the wave module"""
+    with wave.open(str(path), "wb") as out:
+        out.setnchannels(samples.shape[1])
+        out.setsampwidth(2)
+        out.setframerate(sr)
+        out.writeframes(samples.astype(np.int16).tobytes())
+
+
+def write_raw_wav(path, fmt: bytes, data: bytes, extra: bytes = b"", data_size=None):
+    """RIFF file with a custom fmt chunk, optional chunks before data"""
+    data_size = len(data) if data_size is None else data_size
+    body = (
+        b"WAVE"
+        + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + extra
+        + b"data" + struct.pack("<I", data_size) + data
+    )
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+
+def test_header_int16(tmp_path):
+    path = tmp_path / "a.wav"
+    write_wav(path, np.zeros((1000, 2)), sr=22050)
+
+    header = read_wav_header(path)
+
+    assert header.tag == 1
+    assert header.channels == 2
+    assert header.sample_rate == 22050
+    assert header.bits == 16
+    assert header.offset == 44
+    assert header.num_frames == 1000
+
+
+def test_header_not_wav(tmp_path):
+    path = tmp_path / "a.wav"
+    path.write_bytes(b"ID3" + bytes(100))
+    assert read_wav_header(path) is None
+
+
+def test_header_missing_data_chunk(tmp_path):
+    path = tmp_path / "a.wav"
+    fmt = struct.pack("<HHIIHH", 1, 1, 16000, 32000, 2, 16)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+    assert read_wav_header(path) is None
+
+
+def test_header_skips_odd_sized_chunks(tmp_path):
+    path = tmp_path / "a.wav"
+    fmt = struct.pack("<HHIIHH", 1, 1, 16000, 32000, 2, 16)
+    # odd-sized chunks are padded to an even length
+    extra = b"LIST" + struct.pack("<I", 3) + b"abc" + b"\0"
+    write_raw_wav(path, fmt, bytes(200), extra=extra)
+
+    header = read_wav_header(path)
+
+    assert header.offset == 12 + 8 + 16 + 12 + 8
+    assert header.num_frames == 100
+
+
+def test_header_extensible_float(tmp_path):
+    path = tmp_path / "a.wav"
+    fmt = struct.pack("<HHIIHH", 0xFFFE, 1, 16000, 64000, 4, 32)
+    # cbSize, valid bits, channel mask, then the subformat GUID
+    fmt += struct.pack("<HHI", 22, 32, 4) + struct.pack("<H", 3) + bytes(14)
+    write_raw_wav(path, fmt, np.zeros(50, dtype=np.float32).tobytes())
+
+    header = read_wav_header(path)
+
+    assert header.tag == 3
+    assert header.bits == 32
+    assert header.num_frames == 50
+
+
+def test_header_unset_data_size(tmp_path):
+    path = tmp_path / "a.wav"
+    fmt = struct.pack("<HHIIHH", 1, 1, 16000, 32000, 2, 16)
+    write_raw_wav(path, fmt, bytes(300), data_size=0xFFFFFFFF)
+
+    assert read_wav_header(path).num_frames == 150
+
+
+def test_memmap_tensor_is_writable(tmp_path):
+    path = tmp_path / "a.wav"
+    fmt = struct.pack("<HHIIHH", 3, 1, 16000, 64000, 4, 32)
+    samples = np.linspace(-0.5, 0.5, 64, dtype=np.float32)
+    write_raw_wav(path, fmt, samples.tobytes())
+
+    frames, sr = open_wav_memmap(path)
+    waveform = wav_frames_to_tensor(frames)
+    waveform.mul_(2.0)
+
+    assert sr == 16000
+    assert waveform.shape == (1, 64)
+    np.testing.assert_allclose(waveform[0].numpy(), samples * 2.0)
+    # the file is untouched
+    np.testing.assert_allclose(open_wav_memmap(path)[0][:, 0], samples)
+
+
+def test_memmap_int16_normalized(tmp_path):
+    path = tmp_path / "a.wav"
+    write_wav(path, np.array([[0, 16384], [-32768, 32767]]))
+
+    waveform = wav_frames_to_tensor(open_wav_memmap(path)[0])
+
+    assert waveform.shape == (2, 2)
+    np.testing.assert_allclose(waveform.numpy(), [[0.0, -1.0], [0.5, 32767 / 32768]])
+
+
+
+def test_sequential_memmap_matches(tmp_path):
+    path = tmp_path / "a.wav"
+    samples = np.arange(-300, 300, dtype=np.int16).reshape(-1, 2)
+    write_wav(path, samples)
+
+    frames, sr = open_wav_memmap(path, sequential=True)
+
+    assert sr == 16000
+    np.testing.assert_array_equal(frames, open_wav_memmap(path)[0])
+    assert not frames.flags.writeable
+
+def fake_ffmpeg(bin_dir, script: str):
+    """ffmpeg on PATH replaced by a shell script"""
+    bin_dir.mkdir()
+    path = bin_dir / "ffmpeg"
+    path.write_text("#!/bin/sh\n" + script)
+    path.chmod(0o755)
+    return bin_dir
+
+
+def convert_stream(tmp_path, monkeypatch, script: str):
+    bin_dir = fake_ffmpeg(tmp_path / "bin", script)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    job = ConvertJob(
+        src=tmp_path / "in.mp3", out_path=tmp_path / "out.wav",
+        target_sr=16000, target_format="wav", backend="stream", chunk_seconds=0.5,
+    )
+    result = []
+    # a deadlock would hang the test, so convert in a thread with a timeout
+    thread = threading.Thread(
+        target=lambda: result.append(convert_audio_file(job)), daemon=True
+    )
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "ffmpeg pipes deadlocked"
+    return job, result[0][1]
+
+
+def test_stream_backend_writes_chunks(tmp_path, monkeypatch):
+    # 1.5 s of 16 kHz int16 samples, read in three chunks
+    job, error = convert_stream(tmp_path, monkeypatch, "head -c 48000 /dev/zero\n")
+
+    assert error is None
+    with wave.open(str(job.out_path)) as out:
+        assert out.getnframes() == 24000
+        assert out.getframerate() == 16000
+        assert out.getnchannels() == 1
+
+
+def test_stream_backend_survives_verbose_stderr(tmp_path, monkeypatch):
+    # far more warnings than a pipe buffer holds, before any audio
+    script = "yes 'warning: damaged frame' | head -c 2000000 >&2\nhead -c 32000 /dev/zero\n"
+    job, error = convert_stream(tmp_path, monkeypatch, script)
+
+    assert error is None
+    with wave.open(str(job.out_path)) as out:
+        assert out.getnframes() == 16000
+
+
+def test_stream_backend_failure(tmp_path, monkeypatch):
+    job, error = convert_stream(tmp_path, monkeypatch, "echo 'invalid data' >&2\nexit 1\n")
+
+    assert error == "RuntimeError: ffmpeg exited with 1: invalid data"
+    assert not job.out_path.exists()
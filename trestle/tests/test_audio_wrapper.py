@@ -0,0 +1,103 @@
+import os
+import shutil
+import polars as pl
+import pytest
+from trestle.audio import AudioWrapper
+from trestle.io import audio_utils
+
+
+@pytest.fixture
+def converted(monkeypatch) -> list[str]:
+    """
+    The pydub backend replaced by a copy; returns the names of the sources
+    converted so far. Sources starting with "bad" fail.
+    """
+    names = []
+
+    def convert(job):
+        names.append(job.src.name)
+        if job.src.name.startswith("bad"):
+            raise ValueError("cannot decode")
+        shutil.copyfile(job.src, job.out_path)
+
+    monkeypatch.setitem(audio_utils.RESAMPLE_BACKENDS, "pydub", convert)
+    return names
+
+
+def write_sources(root, **files: bytes):
+    audio_dir = root / "s1" / "audio"
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    for name, data in files.items():
+        (audio_dir / f"{name}.mp3").write_bytes(data)
+    return audio_dir
+
+
+def run(tmp_path, converted, **kwargs) -> list[str]:
+    start = len(converted)
+    AudioWrapper("corp", tmp_path / "src", tmp_path / "out", **kwargs).run()
+    return sorted(converted[start:])
+
+
+def test_unchanged_sources_are_skipped(tmp_path, converted):
+    write_sources(tmp_path / "src", a=b"aaaa", b=b"bbbb")
+
+    assert run(tmp_path, converted) == ["a.mp3", "b.mp3"]
+    assert run(tmp_path, converted) == []
+    manifest = pl.read_parquet(tmp_path / "out" / "corp" / "conversion_manifest.parquet")
+    assert sorted(manifest["out_path"].to_list()) == [
+        str(tmp_path / "out" / "corp" / "s1" / f"{name}.wav") for name in "ab"
+    ]
+    # not incremental: everything is converted again
+    assert run(tmp_path, converted, incremental=False) == ["a.mp3", "b.mp3"]
+
+
+def test_changed_or_missing_outputs_are_converted_again(tmp_path, converted):
+    audio_dir = write_sources(tmp_path / "src", a=b"aaaa", b=b"bbbb", c=b"cccc")
+    run(tmp_path, converted)
+
+    (audio_dir / "a.mp3").write_bytes(b"aaaaaa")
+    stat = (audio_dir / "b.mp3").stat()
+    os.utime(audio_dir / "b.mp3", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    (tmp_path / "out" / "corp" / "s1" / "c.wav").unlink()
+
+    assert run(tmp_path, converted) == ["a.mp3", "b.mp3", "c.mp3"]
+    assert (tmp_path / "out" / "corp" / "s1" / "a.wav").read_bytes() == b"aaaaaa"
+    # other settings invalidate the outputs too
+    assert run(tmp_path, converted, target_sr=8000) == ["a.mp3", "b.mp3", "c.mp3"]
+
+
+def test_content_hash_ignores_touched_files(tmp_path, converted):
+    audio_dir = write_sources(tmp_path / "src", a=b"aaaa", b=b"bbbb")
+    run(tmp_path, converted, hash_content=True)
+
+    for name, data in [("a", b"aaaa"), ("b", b"BBBB")]:
+        stat = (audio_dir / f"{name}.mp3").stat()
+        (audio_dir / f"{name}.mp3").write_bytes(data)
+        os.utime(audio_dir / f"{name}.mp3", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    # same size, later mtime: only the file whose content changed
+    assert run(tmp_path, converted, hash_content=True) == ["b.mp3"]
+
+
+def test_failed_conversions_are_retried(tmp_path, converted):
+    write_sources(tmp_path / "src", a=b"aaaa", bad=b"xxxx")
+
+    assert run(tmp_path, converted) == ["a.mp3", "bad.mp3"]
+    assert run(tmp_path, converted) == ["bad.mp3"]
+
+
+def test_orphaned_outputs_are_removed(tmp_path, converted):
+    audio_dir = write_sources(tmp_path / "src", a=b"aaaa", b=b"bbbb")
+    run(tmp_path, converted)
+    (audio_dir / "b.mp3").unlink()
+    out_dir = tmp_path / "out" / "corp" / "s1"
+    manifest_path = tmp_path / "out" / "corp" / "conversion_manifest.parquet"
+
+    # a dry run only reports them
+    run(tmp_path, converted, dry_run=True)
+    assert (out_dir / "b.wav").exists()
+    assert pl.read_parquet(manifest_path).height == 2
+
+    assert run(tmp_path, converted) == []
+    assert sorted(p.name for p in out_dir.iterdir()) == ["a.wav"]
+    assert pl.read_parquet(manifest_path)["source_path"].to_list() == [str(audio_dir / "a.mp3")]
@@ -0,0 +1,131 @@
+import json
+import polars as pl
+from trestle.audio.asr_pipeline import (
+    clear_shard_stats, merge_shard_stats, merge_shards, shard_path
+)
+
+
+def write_shard(out_path, rank, rows):
+    pl.DataFrame(
+        rows, schema=["audio_path", "prediction", "_meta", "_row"], orient="row"
+    ).write_parquet(shard_path(out_path, rank))
+
+
+def test_merges_in_metadata_order(tmp_path):
+    out_path = tmp_path / "model_output.parquet"
+    write_shard(out_path, 1, [("c.wav", "C", 0, 2), ("d.wav", "D", 1, 0)])
+    write_shard(out_path, 0, [("b.wav", "B", 0, 1), ("a.wav", "A", 0, 0)])
+
+    merge_shards(out_path, "parquet", num_shards=2)
+
+    df = pl.read_parquet(out_path)
+    assert df.columns == ["audio_path", "prediction"]
+    assert df["audio_path"].to_list() == ["a.wav", "b.wav", "c.wav", "d.wav"]
+    assert list(tmp_path.iterdir()) == [out_path]
+
+
+def test_drops_duplicates_and_stale_ranks(tmp_path):
+    out_path = tmp_path / "model_output.parquet"
+    write_shard(out_path, 0, [("a.wav", "A", 0, 0), ("b.wav", "B", 0, 1)])
+    write_shard(out_path, 1, [("b.wav", "B2", 0, 1), ("c.wav", "C", 0, 2)])
+    # left over from an earlier run with three workers
+    write_shard(out_path, 2, [("z.wav", "Z", 0, 9)])
+
+    merge_shards(out_path, "parquet", num_shards=2)
+
+    df = pl.read_parquet(out_path)
+    assert df["audio_path"].to_list() == ["a.wav", "b.wav", "c.wav"]
+    assert df["prediction"].to_list() == ["A", "B", "C"]
+    assert not shard_path(out_path, 2).exists()
+
+
+def test_includes_parts_of_interrupted_workers(tmp_path):
+    out_path = tmp_path / "model_output.parquet"
+    write_shard(out_path, 0, [("a.wav", "A", 0, 0)])
+    parts_dir = tmp_path / f"{shard_path(out_path, 1).name}.parts"
+    parts_dir.mkdir()
+    pl.DataFrame(
+        [("b.wav", "B", 0, 1)],
+        schema=["audio_path", "prediction", "_meta", "_row"],
+        orient="row",
+    ).write_parquet(parts_dir / "part-00000.parquet")
+
+    # the interrupted worker left no shard file, only its chunks
+    merge_shards(out_path, "parquet", num_shards=2, resume=True)
+
+    # chunks are merged by the worker's _finalize, not by merge_shards
+    assert pl.read_parquet(out_path)["audio_path"].to_list() == ["a.wav"]
+    assert not parts_dir.exists()
+
+
+def test_resume_keeps_uncovered_rows_last(tmp_path):
+    out_path = tmp_path / "model_output.jsonl"
+    pl.DataFrame({
+        "audio_path": ["gone.wav", "b.wav"],
+        "prediction": ["G", "B"],
+    }).write_ndjson(out_path)
+    write_shard(out_path, 0, [("b.wav", "B", 0, 1), ("a.wav", "A", 0, 0)])
+
+    merge_shards(out_path, "jsonl", num_shards=1, resume=True)
+
+    df = pl.read_ndjson(out_path)
+    assert df["audio_path"].to_list() == ["a.wav", "b.wav", "gone.wav"]
+
+
+def test_nothing_to_merge(tmp_path):
+    out_path = tmp_path / "model_output.parquet"
+    merge_shards(out_path, "parquet", num_shards=2)
+    assert not out_path.exists()
+
+
+def test_merge_shard_stats(tmp_path):
+    fallback = [
+        {"clips": 3, "temperatures": {"0.0": 2, "0.2": 1}, "exhausted": 0},
+        {"clips": 2, "temperatures": {"0.0": 1, "0.2": 1}, "exhausted": 1},
+    ]
+    assist = [
+        {"tokens": 10, "draft_tokens": 8, "target_calls": 4, "target_s": 2.0, "draft_s": 0.5},
+        {"tokens": 20, "draft_tokens": 12, "target_calls": 6, "target_s": 3.0, "draft_s": 1.0},
+    ]
+    for rank in range(2):
+        (tmp_path / f"c_whisper_fallback_stats.rank-{rank:03d}.json").write_text(
+            json.dumps(fallback[rank])
+        )
+        (tmp_path / f"c_whisper_assist_stats.rank-{rank:03d}.json").write_text(
+            json.dumps(assist[rank])
+        )
+    (tmp_path / "c_whisper_fallback_stats.rank-002.json").write_text(json.dumps(fallback[0]))
+    # another corpus sharing meta_root
+    (tmp_path / "d_whisper_fallback_stats.rank-000.json").write_text(json.dumps(fallback[0]))
+
+    merge_shard_stats(tmp_path, "c", num_shards=2)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "c_whisper_assist_stats.json", "c_whisper_fallback_stats.json",
+        "d_whisper_fallback_stats.rank-000.json",
+    ]
+    stats = json.loads((tmp_path / "c_whisper_fallback_stats.json").read_text())
+    assert stats == {"clips": 5, "temperatures": {"0.0": 3, "0.2": 2}, "exhausted": 1}
+
+    stats = json.loads((tmp_path / "c_whisper_assist_stats.json").read_text())
+    assert stats["tokens"] == 30
+    assert stats["accepted"] == 20
+    assert stats["acceptance_rate"] == 1.0
+    # 30 greedy steps at 0.5 s against 6.5 s spent
+    assert abs(stats["est_speedup"] - 15.0 / 6.5) < 1e-9
+
+
+def test_clear_shard_stats(tmp_path):
+    for name in (
+        "c_whisper_fallback_stats.rank-000.json",
+        "c_whisper_greedy_assist_stats.rank-001.json",
+        "c_whisper_fallback_stats.json",
+        "cd_whisper_fallback_stats.rank-000.json",
+    ):
+        (tmp_path / name).write_text("{}")
+
+    clear_shard_stats(tmp_path, "c")
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "c_whisper_fallback_stats.json", "cd_whisper_fallback_stats.rank-000.json",
+    ]
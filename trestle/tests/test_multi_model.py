@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+import pytest
+from trestle.audio.multi_model import MultiCollator, _check_compatible
+
+
+def sample(name: str, decode_s: float = 0.5) -> dict:
+    return {"clip_path": name, "waveform": [0.0], "decode_s": decode_s}
+
+
+def record(batch):
+    return [b["clip_path"] for b in batch]
+
+
+def test_every_collator_gets_the_batch():
+    collate = MultiCollator([record, record])
+
+    num_clips, decode_s, collated = collate([sample("a"), sample("b")])
+
+    assert num_clips == 2
+    assert decode_s == 1.0
+    assert collated == [["a", "b"], ["a", "b"]]
+
+
+def test_skips_are_per_collator():
+    collate = MultiCollator([record, record, record])
+    collate.skips = [{"a"}, set(), {"a", "b"}]
+
+    num_clips, _, collated = collate([sample("a"), sample("b"), sample("c")])
+
+    # the batch still counts every decoded clip
+    assert num_clips == 3
+    assert collated == [["b", "c"], ["a", "b", "c"], ["c"]]
+
+
+def test_undecodable_samples_are_dropped():
+    collate = MultiCollator([record, record])
+    collate.skips = [{"b"}, set()]
+
+    num_clips, decode_s, collated = collate([None, sample("a"), None, sample("b")])
+
+    assert num_clips == 2
+    assert decode_s == 1.0
+    assert collated == [["a"], ["a", "b"]]
+
+
+def test_collators_get_their_own_sample_dicts():
+    def mark(batch):
+        for b in batch:
+            b["marked"] = True
+        return batch
+
+    collate = MultiCollator([mark, record])
+    batch = [sample("a")]
+    _, _, (marked, _) = collate(batch)
+
+    assert marked[0]["marked"]
+    assert "marked" not in batch[0]
+    # the waveform itself is shared, not copied
+    assert marked[0]["waveform"] is batch[0]["waveform"]
+
+
+def pipeline(model_base: str, **overrides):
+    attrs = dict(
+        corpus="corp", root="clips", span=None, batch_size=8,
+        max_samples_per_batch=None, dry_run=False, shard=None,
+        model_base=model_base,
+    )
+    return SimpleNamespace(**{**attrs, **overrides})
+
+
+def test_compatible_pipelines():
+    _check_compatible([pipeline("a"), pipeline("b")])
+
+
+@pytest.mark.parametrize("attr, value", [
+    ("corpus", "other"),
+    ("batch_size", 4),
+    ("max_samples_per_batch", 16_000 * 60),
+    ("dry_run", True),
+])
+def test_rejects_mismatched_pipelines(attr, value):
+    with pytest.raises(ValueError, match=attr):
+        _check_compatible([pipeline("a"), pipeline("b", **{attr: value})])
+
+
+def test_rejects_shared_output_names():
+    with pytest.raises(ValueError):
+        _check_compatible([pipeline("a"), pipeline("a")])
@@ -0,0 +1,56 @@
+import polars as pl
+import pytest
+from trestle.audio import AudioClipDataset, CTCPipeline, run_data_parallel
+
+LENGTHS = {
+    "s1": [8000, 3200, 12000, 4800, 6400],
+    "s2": [16000, 4000, 9600],
+}
+
+
+def pipeline_kwargs(model, root):
+    # one clip per batch: the model has no attention mask, so padding
+    # would make predictions depend on how the blocks split the batches
+    return dict(
+        model_name=str(model), corpus="corp", root=root,
+        batch_size=1, use_flash_attn2=False,
+    )
+
+
+def outputs(out_root) -> dict[str, pl.DataFrame]:
+    return {
+        str(p.relative_to(out_root)): pl.read_parquet(p)
+        for p in sorted(out_root.rglob("*_output.parquet"))
+    }
+
+
+def test_matches_a_single_process(tiny_ctc, virtual_clips, tmp_path):
+    virtual_clips(tmp_path / "clips", "corp", LENGTHS)
+    kwargs = pipeline_kwargs(tiny_ctc, tmp_path / "clips")
+    CTCPipeline(**kwargs, out_root=tmp_path / "ref", device="cpu").run(AudioClipDataset)
+
+    paths = run_data_parallel(
+        CTCPipeline, AudioClipDataset, num_procs=2,
+        out_root=tmp_path / "dp", device="cpu", threads_per_proc=1, **kwargs,
+    )
+
+    ref = outputs(tmp_path / "ref")
+    assert sorted(str(p.relative_to(tmp_path / "dp")) for p in paths) == sorted(ref)
+    for name, df in outputs(tmp_path / "dp").items():
+        # merged in metadata order, without the order columns
+        assert df.equals(ref[name])
+    # no shards or parts are left behind
+    assert sorted(p.name for p in (tmp_path / "dp").rglob("*") if p.is_file()) == [
+        "tiny_ctc0_output.parquet", "tiny_ctc0_output.parquet",
+    ]
+
+
+def test_worker_failure_raises(virtual_clips, tmp_path):
+    virtual_clips(tmp_path / "clips", "corp", LENGTHS)
+    kwargs = pipeline_kwargs(tmp_path / "missing", tmp_path / "clips")
+
+    with pytest.raises(RuntimeError, match="worker"):
+        run_data_parallel(
+            CTCPipeline, AudioClipDataset, num_procs=2,
+            out_root=tmp_path / "dp", device="cpu", threads_per_proc=1, **kwargs,
+        )
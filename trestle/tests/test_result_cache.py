@@ -0,0 +1,133 @@
+import itertools
+import multiprocessing
+import os
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import trestle.io.result_cache as result_cache
+from trestle.io.result_cache import EncoderCache, ResultCache, audio_hash
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.time() of the cache ticks once per call"""
+    ticks = itertools.count()
+    monkeypatch.setattr(result_cache, "time", SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def stored_bytes(cache: ResultCache) -> int:
+    return cache._connect().execute("SELECT SUM(size) FROM results").fetchone()[0]
+
+
+def test_key_is_the_namespaced_audio_hash(tmp_path):
+    waveform = np.linspace(-1, 1, 160, dtype=np.float32)
+    first = ResultCache(tmp_path / "a.sqlite", namespace={"model": "a"})
+    second = ResultCache(tmp_path / "b.sqlite", namespace={"model": "b"})
+
+    assert first.key(waveform, 16000) == audio_hash(waveform, 16000, first.namespace)
+    assert first.key(waveform, 16000) != second.key(waveform, 16000)
+    assert first.key(waveform, 16000) != first.key(waveform, 8000)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    # every entry takes 1 + 9 bytes, the cache holds three
+    cache = ResultCache(tmp_path / "c.sqlite", namespace={}, max_mb=35 / 1024 ** 2)
+    for key in "abc":
+        cache.put_many({key: "x" * 9})
+    cache.touch(["a"])
+
+    cache.put_many({"d": "x" * 9})
+
+    assert sorted(cache.get_many(list("abcd"))) == ["a", "c", "d"]
+    assert cache._total_bytes == stored_bytes(cache) == 30
+
+
+def test_replaced_entries_are_not_counted_twice(tmp_path):
+    cache = ResultCache(tmp_path / "c.sqlite", namespace={}, max_mb=1)
+    cache.put_many({"a": "x" * 9, "b": "y"})
+    cache.put_many({"a": "z"})
+
+    assert cache.get_many(["a", "b"]) == {"a": "z", "b": "y"}
+    assert cache._total_bytes == stored_bytes(cache) == 4
+    # a new process starts from what is on disk
+    cache.close()
+    reopened = ResultCache(tmp_path / "c.sqlite", namespace={}, max_mb=1)
+    reopened.put_many({"c": "w"})
+    assert reopened._total_bytes == 6
+
+
+def _lookup_and_report(cache, queue):
+    conn = cache._conn
+    found = cache.get_many(["a"])
+    queue.put((found, cache._conn is not conn, cache._pid == os.getpid()))
+
+
+def test_forked_worker_opens_its_own_connection(tmp_path):
+    cache = ResultCache(tmp_path / "c.sqlite", namespace={})
+    cache.put_many({"a": "x"})
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    worker = ctx.Process(target=_lookup_and_report, args=(cache, queue))
+    worker.start()
+    found, reconnected, owned = queue.get(timeout=60)
+    worker.join()
+
+    assert found == {"a": "x"}
+    assert reconnected and owned
+    # the parent's connection is untouched
+    cache.put_many({"b": "y"})
+    assert cache.get_many(["a", "b"]) == {"a": "x", "b": "y"}
+
+
+def test_encoder_cache_round_trip(tmp_path):
+    cache = EncoderCache(tmp_path, namespace={"model": "m"})
+    hidden = np.arange(12, dtype=np.float16).reshape(3, 4)
+
+    assert cache.get("clip") is None
+    cache.put("clip", hidden)
+
+    np.testing.assert_array_equal(cache.get("clip"), hidden)
+    assert cache.get("clip").dtype == np.float16
+    assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == [cache._path("clip").name]
+
+
+def test_encoder_cache_namespaces(tmp_path):
+    first = EncoderCache(tmp_path, namespace={"model": "a"})
+    second = EncoderCache(tmp_path, namespace={"model": "b"})
+
+    first.put("clip", np.zeros(2, dtype=np.float32))
+
+    assert second.get("clip") is None
+
+
+def _put_and_report(cache, queue):
+    names = []
+    real_replace = os.replace
+
+    def replace(src, dst):
+        names.append(os.path.basename(src))
+        real_replace(src, dst)
+
+    os.replace = replace
+    try:
+        cache.put("clip", np.ones(4, dtype=np.float32))
+    finally:
+        os.replace = real_replace
+    queue.put(names)
+
+
+def test_encoder_cache_temp_file_is_per_process(tmp_path):
+    cache = EncoderCache(tmp_path, namespace={"model": "m"})
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    workers = [ctx.Process(target=_put_and_report, args=(cache, queue)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    names = [queue.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    # two workers writing the same clip use different temp files
+    assert len({name for worker_names in names for name in worker_names}) == 2
+    np.testing.assert_array_equal(cache.get("clip"), np.ones(4))
+    assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == [cache._path("clip").name]
@@ -0,0 +1,53 @@
+import polars as pl
+import pytest
+from trestle.audio import AudioClipDataset, CTCPipeline
+
+LENGTHS = {
+    "s1": [8000, 3200, 12000, 4800, 6400, 1600],
+    "s2": [16000, 4000, 9600, 2400],
+}
+
+
+def pipeline(model, tmp_path, out: str, **kwargs) -> CTCPipeline:
+    return CTCPipeline(
+        model_name=str(model), corpus="corp", root=tmp_path / "clips",
+        out_root=tmp_path / out, device="cpu", use_flash_attn2=False,
+        **kwargs,
+    )
+
+
+def outputs(paths) -> dict[str, pl.DataFrame]:
+    return {p.parent.name: pl.read_parquet(p) for p in paths}
+
+
+def test_resume_with_other_batching_keeps_metadata_order(tiny_ctc, virtual_clips, tmp_path):
+    virtual_clips(tmp_path / "clips", "corp", LENGTHS)
+    # one clip per batch: without an attention mask, padding would change
+    # the predictions of the two runs
+    ref = outputs(pipeline(tiny_ctc, tmp_path, "ref", batch_size=1).run(AudioClipDataset))
+
+    # interrupted after the first two clips of every subset
+    pipeline(tiny_ctc, tmp_path, "out", batch_size=1).run(AudioClipDataset, limit=2)
+    resumed = pipeline(
+        tiny_ctc, tmp_path, "out", batch_size=1, sort_by_length=True, resume=True,
+    ).run(AudioClipDataset)
+
+    for subset, df in outputs(resumed).items():
+        assert df.equals(ref[subset])
+
+
+@pytest.mark.parametrize("batching", [
+    dict(batch_size=3, sort_by_length=True),
+    dict(batch_size=8, max_samples_per_batch=20_000),
+])
+def test_resume_neither_drops_nor_repeats_clips(tiny_ctc, virtual_clips, tmp_path, batching):
+    meta_paths = virtual_clips(tmp_path / "clips", "corp", LENGTHS)
+
+    pipeline(tiny_ctc, tmp_path, "out", batch_size=2).run(AudioClipDataset, limit=3)
+    resumed = pipeline(tiny_ctc, tmp_path, "out", resume=True, **batching).run(AudioClipDataset)
+
+    dfs = outputs(resumed)
+    assert len(dfs) == len(meta_paths)
+    for meta_path in meta_paths:
+        expected = AudioClipDataset(meta_path).clip_paths().to_list()
+        assert dfs[meta_path.parent.name]["audio_path"].to_list() == expected
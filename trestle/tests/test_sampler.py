@@ -0,0 +1,49 @@
+import pytest
+from trestle.audio.sampler import LengthBucketBatchSampler
+
+
+def test_requires_a_limit():
+    with pytest.raises(ValueError):
+        LengthBucketBatchSampler([1, 2, 3])
+
+
+def test_batch_size_buckets_by_length():
+    lengths = [50, 10, 40, 20, 30]
+    sampler = LengthBucketBatchSampler(lengths, batch_size=2)
+
+    assert list(sampler) == [[1, 3], [4, 2], [0]]
+    assert len(sampler) == 3
+
+
+def test_every_index_once():
+    lengths = [7, 3, 3, 9, 1, 7, 2, 3]
+    sampler = LengthBucketBatchSampler(lengths, batch_size=3)
+
+    assert sorted(i for batch in sampler for i in batch) == list(range(len(lengths)))
+
+
+def test_ties_keep_index_order():
+    sampler = LengthBucketBatchSampler([5, 5, 5, 5], batch_size=3)
+    assert list(sampler) == [[0, 1, 2], [3]]
+
+
+def test_padded_sample_budget():
+    lengths = [100, 100, 100, 250, 300, 1000]
+    sampler = LengthBucketBatchSampler(lengths, max_samples_per_batch=600)
+
+    batches = list(sampler)
+    assert batches == [[0, 1, 2], [3, 4], [5]]
+    for batch in batches[:-1]:
+        assert len(batch) * max(lengths[i] for i in batch) <= 600
+
+
+def test_clip_over_budget_gets_its_own_batch():
+    sampler = LengthBucketBatchSampler([10, 5000, 20], max_samples_per_batch=100)
+    assert list(sampler) == [[0, 2], [1]]
+
+
+def test_both_limits():
+    sampler = LengthBucketBatchSampler(
+        [10] * 5, batch_size=2, max_samples_per_batch=1000
+    )
+    assert list(sampler) == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,65 @@
+import wave
+import numpy as np
+import polars as pl
+import trestle.audio.audio_processor as audio_processor
+from trestle.audio import ShardedClipDataset
+
+
+def write_shards(root, num_shards: int, clips_per_shard: int = 2, frames: int = 100):
+    """int16 shards of back-to-back clips, each clip filled with its row number"""
+    rows = []
+    for shard in range(num_shards):
+        path = root / f"shard-{shard:03d}.wav"
+        clips = [shard * clips_per_shard + i for i in range(clips_per_shard)]
+        with wave.open(str(path), "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(16000)
+            out.writeframes(np.repeat(np.array(clips, dtype=np.int16), frames).tobytes())
+        for i, clip in enumerate(clips):
+            rows.append(dict(
+                clip_path=f"clip{clip}.wav", shard=str(path),
+                start_frame=i * frames, end_frame=(i + 1) * frames,
+            ))
+    pl.DataFrame(rows).write_parquet(root / "metadata.parquet")
+    return root / "metadata.parquet"
+
+
+def count_opens(monkeypatch) -> list:
+    opened = []
+    open_wav_memmap = audio_processor.open_wav_memmap
+
+    def record(path, **kwargs):
+        opened.append(path)
+        return open_wav_memmap(path, **kwargs)
+
+    monkeypatch.setattr(audio_processor, "open_wav_memmap", record)
+    return opened
+
+
+def clip_value(sample) -> int:
+    return round(sample["waveform"][0] * 32768)
+
+
+def test_interleaved_shards_stay_mapped(tmp_path, monkeypatch):
+    opened = count_opens(monkeypatch)
+    dataset = ShardedClipDataset(write_shards(tmp_path, num_shards=3))
+
+    # rows alternate between shards, as a length-bucketed batch would
+    order = [0, 2, 4, 1, 3, 5, 0, 4]
+    values = [clip_value(dataset[i]) for i in order]
+
+    assert values == order
+    assert len(opened) == 3
+
+
+def test_least_recently_used_shard_is_unmapped(tmp_path, monkeypatch):
+    opened = count_opens(monkeypatch)
+    dataset = ShardedClipDataset(write_shards(tmp_path, num_shards=3), max_open=2)
+
+    for i in [0, 2, 0, 4, 2]:
+        dataset[i]
+
+    # shard 1 was the least recently used when shard 2 was opened
+    assert [p.rsplit("-", 1)[1] for p in opened] == ["000.wav", "001.wav", "002.wav", "001.wav"]
+    assert len(dataset._sources) == 2
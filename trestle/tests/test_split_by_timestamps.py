@@ -0,0 +1,31 @@
+from trestle.audio.asr_pipeline import split_by_timestamps
+
+
+def test_one_segment_per_clip():
+    text = "<|0.00|> hello there<|1.00|><|1.20|> world<|2.50|>"
+    assert split_by_timestamps(text, [(0.0, 1.1), (1.1, 3.0)]) == ["hello there", "world"]
+
+
+def test_segments_of_one_clip_are_joined():
+    text = "<|0.00|> a<|0.50|><|0.50|> b<|0.90|><|1.50|> c<|2.00|>"
+    assert split_by_timestamps(text, [(0.0, 1.0), (1.0, 2.0)]) == ["a b", "c"]
+
+
+def test_clip_without_speech_is_empty():
+    text = "<|0.00|> only<|0.80|>"
+    assert split_by_timestamps(text, [(0.0, 1.0), (1.0, 2.0), (2.0, 3.0)]) == ["only", "", ""]
+
+
+def test_segment_in_a_gap_goes_to_the_closest_clip():
+    # midpoint 2.6 lies between the clips, closer to the second
+    text = "<|2.40|> late<|2.80|>"
+    assert split_by_timestamps(text, [(0.0, 1.0), (3.0, 4.0)]) == ["", "late"]
+
+
+def test_text_without_timestamps():
+    assert split_by_timestamps(" plain text", [(0.0, 1.0), (1.0, 2.0)]) == ["plain text", ""]
+
+
+def test_trailing_segment_without_end():
+    text = "<|0.00|> first<|1.00|><|3.10|> cut off"
+    assert split_by_timestamps(text, [(0.0, 2.0), (3.0, 4.0)]) == ["first", "cut off"]
@@ -0,0 +1,61 @@
+import polars as pl
+import pytest
+from trestle.io.table_writer import ChunkedTableWriter, read_table
+
+
+def rows(start: int, n: int) -> list[dict]:
+    return [{"clip_path": f"c{i}.wav", "num_frames": i} for i in range(start, start + n)]
+
+
+def test_flushes_whole_buffer(tmp_path):
+    writer = ChunkedTableWriter(tmp_path / "metadata.parquet", flush_every=3)
+
+    writer.write(rows(0, 2))
+    assert writer.read_parts() is None
+
+    # one recording's rows are never split across parts
+    writer.write(rows(2, 4))
+    parts = sorted(writer.parts_dir.glob("part-*.parquet"))
+    assert len(parts) == 1
+    assert pl.read_parquet(parts[0]).height == 6
+
+
+@pytest.mark.parametrize("format", ["parquet", "jsonl", "csv"])
+def test_finalize_merges_parts(tmp_path, format):
+    out_path = tmp_path / f"metadata.{format}"
+    writer = ChunkedTableWriter(out_path, format=format, flush_every=2)
+    for start in range(0, 7, 2):
+        writer.write(rows(start, 2))
+    writer.write(rows(8, 1))
+
+    df = writer.finalize()
+
+    assert df["num_frames"].to_list() == list(range(9))
+    assert read_table(out_path, format)["clip_path"].to_list() == df["clip_path"].to_list()
+    assert not writer.parts_dir.exists()
+
+
+def test_resumes_part_numbering(tmp_path):
+    out_path = tmp_path / "metadata.parquet"
+    first = ChunkedTableWriter(out_path, flush_every=2)
+    first.write(rows(0, 2))
+    first.write(rows(2, 1))
+    # interrupted: the unflushed row is lost
+
+    second = ChunkedTableWriter(out_path, flush_every=2)
+    assert second.read_parts()["num_frames"].to_list() == [0, 1]
+    second.write(rows(3, 2))
+
+    assert second.finalize()["num_frames"].to_list() == [0, 1, 3, 4]
+
+
+def test_clear(tmp_path):
+    writer = ChunkedTableWriter(tmp_path / "metadata.parquet", flush_every=1)
+    writer.write(rows(0, 1))
+    writer.write(rows(1, 1))
+
+    writer.clear()
+
+    assert writer.read_parts() is None
+    assert writer.finalize() is None
+    assert not (tmp_path / "metadata.parquet").exists()
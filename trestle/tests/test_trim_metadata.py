@@ -0,0 +1,68 @@
+import shutil
+import wave
+import numpy as np
+import polars as pl
+from trestle.audio import AudioClipper, VADConfig, trim_metadata
+
+SR = 16_000
+
+
+def write_source(path):
+    """4 s recording: a tone at 0.5-1.0 s and at 2.5-3.5 s, silence elsewhere"""
+    samples = np.zeros(4 * SR, dtype=np.int16)
+    t = np.arange(SR) / SR
+    tone = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+    samples[SR // 2:SR] = tone[:SR // 2]
+    samples[5 * SR // 2:7 * SR // 2] = tone
+    with wave.open(str(path), "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(SR)
+        out.writeframes(samples.tobytes())
+
+
+def make_corpus(tmp_path):
+    source = tmp_path / "rec.wav"
+    write_source(source)
+    text_dir = tmp_path / "text" / "corp" / "s1"
+    text_dir.mkdir(parents=True)
+    pl.DataFrame({
+        "start": [0, 2000],
+        "end": [2000, 4000],
+        "text": ["a", "b"],
+        "pid": ["p", "p"],
+        "audio_path": [str(source)] * 2,
+    }).write_parquet(text_dir / "task_utterance.parquet")
+    return tmp_path / "text"
+
+
+def test_clipper_trims_with_workers(tmp_path):
+    clipper = AudioClipper(
+        "corp", make_corpus(tmp_path), tmp_path / "out",
+        clip_store="virtual", num_workers=2, vad=VADConfig(pad_ms=0),
+    )
+    clipper.run()
+
+    df = pl.read_parquet(tmp_path / "out" / "corp" / "s1" / "metadata.parquet")
+    # offsets inside each 2 s clip
+    assert df["vad_starts"].to_list() == [[SR // 2], [SR // 2]]
+    assert df["vad_ends"].to_list() == [[SR], [3 * SR // 2]]
+    assert df["vad_num_frames"].to_list() == [SR // 2, SR]
+
+
+def test_workers_match_the_serial_path(tmp_path):
+    AudioClipper(
+        "corp", make_corpus(tmp_path), tmp_path / "out", clip_store="virtual"
+    ).run()
+    meta_path = tmp_path / "out" / "corp" / "s1" / "metadata.parquet"
+    copy = meta_path.with_name("copy.parquet")
+    shutil.copy(meta_path, copy)
+    config = VADConfig(pad_ms=100)
+
+    serial = trim_metadata(meta_path, config)
+    parallel = trim_metadata(copy, config, num_workers=2)
+
+    assert serial == parallel
+    assert serial["clips"] == 2
+    assert abs(serial["audio_s"] - 4.0) < 1e-9
+    assert pl.read_parquet(meta_path).equals(pl.read_parquet(copy))
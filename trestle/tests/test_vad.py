@@ -0,0 +1,90 @@
+import numpy as np
+from trestle.audio.vad import VADConfig, apply_segments, speech_segments
+
+SR = 16_000
+
+
+def clip(*parts: tuple[float, float]) -> np.ndarray:
+    """
+    Concatenated (seconds, amplitude) parts of a 440 Hz tone
+    """
+    out = []
+    for seconds, amplitude in parts:
+        t = np.arange(int(seconds * SR)) / SR
+        out.append(amplitude * np.sin(2 * np.pi * 440 * t))
+    return np.concatenate(out).astype(np.float32)
+
+
+def test_trims_leading_and_trailing_silence():
+    waveform = clip((1.0, 0.0), (0.5, 0.5), (1.0, 0.0))
+    segments = speech_segments(waveform, SR, VADConfig(pad_ms=100))
+
+    # speech at 1.0-1.5 s, padded by 100 ms on both sides
+    assert segments.tolist() == [[int(0.9 * SR), int(1.6 * SR)]]
+
+
+def test_keeps_internal_pauses_without_split():
+    waveform = clip((0.5, 0.0), (0.3, 0.5), (1.0, 0.0), (0.3, 0.5), (0.5, 0.0))
+    segments = speech_segments(waveform, SR, VADConfig(pad_ms=0))
+
+    assert segments.tolist() == [[int(0.5 * SR), int(2.1 * SR)]]
+
+
+def test_splits_long_pauses():
+    waveform = clip((0.5, 0.0), (0.3, 0.5), (1.0, 0.0), (0.3, 0.5), (0.5, 0.0))
+    config = VADConfig(pad_ms=100, split_pause_ms=500)
+    segments = speech_segments(waveform, SR, config)
+
+    assert segments.tolist() == [
+        [int(0.4 * SR), int(0.9 * SR)],
+        [int(1.7 * SR), int(2.2 * SR)],
+    ]
+
+
+def test_short_pause_is_not_split():
+    waveform = clip((0.3, 0.5), (0.2, 0.0), (0.3, 0.5))
+    segments = speech_segments(waveform, SR, VADConfig(pad_ms=0, split_pause_ms=500))
+
+    assert segments.tolist() == [[0, len(waveform)]]
+
+
+def test_clicks_are_ignored():
+    # a 20 ms click is shorter than min_speech_ms
+    waveform = clip((0.5, 0.0), (0.02, 0.9), (0.5, 0.0), (0.4, 0.5), (0.5, 0.0))
+    segments = speech_segments(waveform, SR, VADConfig(pad_ms=0))
+
+    assert segments.tolist() == [[int(1.02 * SR), int(1.42 * SR)]]
+
+
+def test_silent_clip_is_kept_whole():
+    waveform = np.zeros(SR, dtype=np.float32)
+    assert speech_segments(waveform, SR, VADConfig()).tolist() == [[0, SR]]
+
+
+def test_clip_shorter_than_a_frame_is_kept_whole():
+    waveform = clip((0.01, 0.5))
+    assert speech_segments(waveform, SR, VADConfig()).tolist() == [[0, len(waveform)]]
+
+
+def test_speech_reaching_the_end_keeps_the_partial_frame():
+    # 1.005 s: the last 5 ms do not fill a 20 ms frame
+    waveform = clip((0.5, 0.0), (0.505, 0.5))
+    segments = speech_segments(waveform, SR, VADConfig(pad_ms=0))
+
+    assert segments.tolist() == [[int(0.5 * SR), len(waveform)]]
+
+
+def test_apply_segments():
+    waveform = np.arange(10, dtype=np.float32)
+
+    assert apply_segments(waveform, [2], [5]).tolist() == [2, 3, 4]
+    assert apply_segments(waveform, [0, 7], [2, 9]).tolist() == [0, 1, 7, 8]
+
+
+def test_apply_segments_of_speech_segments():
+    waveform = clip((0.5, 0.0), (0.3, 0.5), (1.0, 0.0), (0.3, 0.5), (0.5, 0.0))
+    segments = speech_segments(waveform, SR, VADConfig(pad_ms=0, split_pause_ms=500))
+    trimmed = apply_segments(waveform, segments[:, 0], segments[:, 1])
+
+    assert len(trimmed) == int(0.6 * SR)
+    assert np.abs(trimmed).max() > 0.4
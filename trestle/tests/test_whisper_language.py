@@ -0,0 +1,158 @@
+import wave
+import numpy as np
+import polars as pl
+import pytest
+import torch
+from transformers import (
+    GenerationConfig,
+    WhisperConfig,
+    WhisperFeatureExtractor,
+    WhisperForConditionalGeneration,
+    WhisperProcessor,
+    WhisperTokenizer,
+)
+from transformers.convert_slow_tokenizer import bytes_to_unicode
+from trestle.audio import AudioClipDataset, Seq2SeqPipeline
+
+LANGUAGES = ["en", "de", "fr"]
+SPECIALS = (
+    ["<|endoftext|>", "<|startoftranscript|>"]
+    + [f"<|{lang}|>" for lang in LANGUAGES]
+    + ["<|translate|>", "<|transcribe|>", "<|startoflm|>", "<|startofprev|>",
+       "<|nospeech|>", "<|notimestamps|>"]
+)
+
+
+def tiny_whisper(path, multilingual: bool):
+    """
+    Randomly initialised two-layer whisper; English-only checkpoints have
+    no lang_to_id/task_to_id in their generation config
+    """
+    torch.manual_seed(0)
+    vocab = {c: i for i, c in enumerate(bytes_to_unicode().values())}
+    tokenizer = WhisperTokenizer(vocab=vocab, merges=[])
+    tokenizer.add_tokens(SPECIALS, special_tokens=True)
+    tokenizer.add_tokens([f"<|{i * 0.02:.2f}|>" for i in range(1501)])
+    ids = {t: tokenizer.convert_tokens_to_ids(t) for t in SPECIALS}
+    eot = ids["<|endoftext|>"]
+
+    model = WhisperForConditionalGeneration(WhisperConfig(
+        vocab_size=len(tokenizer), num_mel_bins=80, d_model=64,
+        encoder_layers=2, decoder_layers=2,
+        encoder_attention_heads=2, decoder_attention_heads=2,
+        encoder_ffn_dim=128, decoder_ffn_dim=128,
+        max_source_positions=1500, max_target_positions=448,
+        pad_token_id=eot, bos_token_id=eot, eos_token_id=eot,
+        decoder_start_token_id=ids["<|startoftranscript|>"],
+        begin_suppress_tokens=[eot], suppress_tokens=[],
+    ))
+    languages = {}
+    if multilingual:
+        languages = dict(
+            lang_to_id={f"<|{lang}|>": ids[f"<|{lang}|>"] for lang in LANGUAGES},
+            task_to_id={"transcribe": ids["<|transcribe|>"], "translate": ids["<|translate|>"]},
+        )
+    model.generation_config = GenerationConfig(
+        decoder_start_token_id=ids["<|startoftranscript|>"],
+        bos_token_id=eot, eos_token_id=eot, pad_token_id=eot,
+        max_length=448, is_multilingual=multilingual,
+        no_timestamps_token_id=ids["<|notimestamps|>"],
+        prev_sot_token_id=ids["<|startofprev|>"],
+        max_initial_timestamp_index=50,
+        begin_suppress_tokens=[eot], suppress_tokens=[],
+        return_timestamps=False,
+        **languages,
+    )
+    model.save_pretrained(path)
+    WhisperProcessor(
+        feature_extractor=WhisperFeatureExtractor(feature_size=80), tokenizer=tokenizer
+    ).save_pretrained(path)
+    return path
+
+
+def write_clips(root):
+    """Three virtual clips of a noisy 2 s recording"""
+    meta_dir = root / "corp" / "s1"
+    meta_dir.mkdir(parents=True)
+    source = root / "rec.wav"
+    rng = np.random.default_rng(0)
+    with wave.open(str(source), "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(16000)
+        out.writeframes((rng.standard_normal(32000) * 3000).astype(np.int16).tobytes())
+    pl.DataFrame({
+        "clip_path": [f"clip{i}.wav" for i in range(3)],
+        "source_audio": [str(source)] * 3,
+        "start_frame": [0, 8000, 16000],
+        "end_frame": [8000, 16000, 32000],
+        "sample_rate": [16000] * 3,
+    }).write_parquet(meta_dir / "metadata.parquet")
+    return root
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+    base = tmp_path_factory.mktemp("models")
+    return {
+        "en": tiny_whisper(base / "tiny.en", multilingual=False),
+        "multi": tiny_whisper(base / "tiny", multilingual=True),
+    }
+
+
+def predictions(model, tmp_path, name, **kwargs):
+    pipeline = Seq2SeqPipeline(
+        model_name=str(model),
+        corpus="corp",
+        root=tmp_path / "clips",
+        out_root=tmp_path / name,
+        meta_root=tmp_path / name / "meta",
+        device="cpu",
+        batch_size=2,
+        use_flash_attn2=False,
+        **kwargs,
+    )
+    paths = pipeline.run(AudioClipDataset)
+    return pl.concat([pl.read_parquet(p) for p in paths])["prediction"].to_list()
+
+
+@pytest.fixture
+def clips(tmp_path):
+    return write_clips(tmp_path / "clips")
+
+
+def test_fallback_on_english_only_model(models, tmp_path, clips):
+    # every sample fails the threshold, so all temperatures are decoded
+    gen_config = dict(max_new_tokens=4, temperature=(0.0, 0.5), logprob_threshold=0.0)
+
+    texts = predictions(models["en"], tmp_path, "fallback", gen_config=gen_config)
+
+    assert len(texts) == 3
+    stats = pl.read_json(tmp_path / "fallback" / "meta" / "corp_whisper_fallback_stats.json")
+    assert stats["exhausted"].item() == 3
+
+
+@pytest.mark.parametrize("model", ["en", "multi"])
+def test_fallback_matches_plain_decoding(models, tmp_path, clips, model):
+    # thresholds every sample passes: the first temperature is final
+    fallback = dict(max_new_tokens=4, temperature=(0.0, 0.5), logprob_threshold=-1e9)
+
+    plain = predictions(models[model], tmp_path, "plain", gen_config=dict(max_new_tokens=4))
+    texts = predictions(models[model], tmp_path, "fallback", gen_config=fallback)
+
+    assert texts == plain
+
+
+@pytest.mark.parametrize("model", ["en", "multi"])
+def test_assisted_matches_plain_decoding(models, tmp_path, clips, model):
+    gen_config = dict(max_new_tokens=4, num_beams=1)
+
+    plain = predictions(models[model], tmp_path, "plain", gen_config=gen_config)
+    texts = predictions(
+        models[model], tmp_path, "assisted",
+        gen_config=gen_config, draft_model=str(models[model]),
+    )
+
+    assert texts == plain
+    stats = pl.read_json(tmp_path / "assisted" / "meta" / "corp_whisper_assist_stats.json")
+    assert stats["tokens"].item() > 0